@@ -1,4 +1,31 @@
 # -*- mode: python ; coding: utf-8 -*-
+import argparse
+
+# pyinstaller add_watermarking.spec [-- --profile lean]
+#   onefile  One VideoWatermarker executable; it unpacks itself to a
+#            temporary folder on every start
+#   lean     A VideoWatermarker folder instead: nothing to unpack, no UPX
+#            to decompress, and none of the modules and data files below.
+#            It holds two executables sharing the same files: the windowed
+#            VideoWatermarker for the GUI, and the console VideoWatermarkerCLI
+#            that headless runs (--version, --probe, batches) use, since a
+#            windowed build has no stdout or stderr on Windows. Startup is
+#            compared with benchmarks/startup.py --exe on the latter
+parser = argparse.ArgumentParser()
+parser.add_argument('--profile', choices=('onefile', 'lean'), default='onefile')
+profile = parser.parse_args().profile
+lean = profile == 'lean'
+
+# Never imported by any code path. OpenCV's own Python modules all load
+# with cv2, so it is trimmed by files: Haar cascades (cv2/data) and the Qt
+# plugins and fonts used only by cv2.imshow (opencv-python-headless has
+# none of these at all)
+LEAN_EXCLUDES = [
+    'numpy.f2py', 'numpy.distutils', 'numpy.testing',
+    'PIL.ImageQt', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6',
+    'matplotlib', 'scipy', 'pandas', 'IPython', 'pytest', 'doctest', 'pydoc',
+]
+LEAN_EXCLUDED_FILES = ('cv2/data/', 'cv2/qt/')
 
 block_cipher = None
 
@@ -7,35 +34,35 @@ a = Analysis(
     pathex=[],
     binaries = [
         ('**/opencv_videoio_ffmpeg*.dll', '.'),  # Recursive search
-    ]
+    ],
     datas=[],
     hiddenimports=['PIL._tkinter_finder', 'cv2', 'numpy', 'PIL'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=LEAN_EXCLUDES if lean else [],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
     noarchive=False,
 )
 
+if lean:
+    def kept(entries):
+        return [entry for entry in entries
+                if not any(part in entry[0].replace('\\', '/') for part in LEAN_EXCLUDED_FILES)]
+    a.binaries = kept(a.binaries)
+    a.datas = kept(a.datas)
+
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    [],
+exe_options = dict(
     name='VideoWatermarker',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=not lean,
     upx_exclude=[],
-    runtime_tmpdir=None,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -44,4 +71,23 @@ exe = EXE(
     entitlements_file=None,
     icon=None,
     version='file_version_info.txt',
-) 
\ No newline at end of file
+)
+
+if lean:
+    exe = EXE(pyz, a.scripts, [], exclude_binaries=True, **exe_options)
+    cli_exe = EXE(
+        pyz, a.scripts, [], exclude_binaries=True,
+        **dict(exe_options, name='VideoWatermarkerCLI', console=True)
+    )
+    coll = COLLECT(exe, cli_exe, a.binaries, a.zipfiles, a.datas, strip=False, upx=False, name='VideoWatermarker')
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        [],
+        runtime_tmpdir=None,
+        **exe_options
+    )
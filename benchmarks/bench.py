@@ -0,0 +1,264 @@
+"""
+Benchmark the watermark and compression paths on synthetic videos.
+
+Generates test videos with FFmpeg's testsrc2 (optionally with a sine-wave
+audio track) and logos of several sizes and alpha patterns, then times each
+stage in a fresh process:
+
+    decode    read loop (cv2.VideoCapture, or FFmpegReader with --reader ffmpeg)
+    blend     overlay blending on decoded frames
+    encode    raw frames piped through FFmpegWriter (libx264)
+    pipeline  add_moving_watermark_with_alpha end to end (compress=True)
+    compress  compress_video on an mp4v intermediate
+
+Results (fps, seconds per stage, peak RSS, output size) are written as JSON
+so runs from different commits can be compared:
+
+    python benchmarks/bench.py --output results.json
+    python benchmarks/bench.py --output new.json --compare results.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from utils.memory import peak_rss_mb  # noqa: E402
+
+RESOLUTIONS = {'480p': (854, 480), '720p': (1280, 720), '1080p': (1920, 1080), '2160p': (3840, 2160)}
+FRAME_RATES = (24, 30, 60)
+LOGO_SIZES = {'small': 64, 'medium': 256, 'large': 1024}
+ALPHA_PATTERNS = ('opaque', 'gradient', 'binary', 'soft')
+STAGES = ('decode', 'blend', 'encode', 'pipeline', 'compress')
+
+PROFILES = {
+    'quick': {
+        'resolutions': ('480p', '1080p'), 'frame_rates': (30,), 'audio': (True,),
+        'logos': (('medium', 'gradient'),),
+    },
+    'full': {
+        'resolutions': tuple(RESOLUTIONS), 'frame_rates': FRAME_RATES, 'audio': (False, True),
+        'logos': tuple(itertools.product(LOGO_SIZES, ALPHA_PATTERNS)),
+    },
+}
+
+
+def make_video(path: str, resolution: str, fps: int, seconds: float, audio: bool):
+    """Generate a synthetic H.264 test video with FFmpeg's testsrc2."""
+    width, height = RESOLUTIONS[resolution]
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={seconds}',
+    ]
+    if audio:
+        cmd += ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}', '-c:a', 'aac']
+    cmd += ['-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path]
+    subprocess.run(cmd, check=True)
+
+
+def make_logo(path: str, size: str, pattern: str):
+    """Write a BGRA PNG logo with the given width and alpha pattern."""
+    width = LOGO_SIZES[size]
+    height = max(1, width // 2)
+    yy, xx = np.mgrid[0:height, 0:width]
+
+    logo = np.zeros((height, width, 4), dtype=np.uint8)
+    logo[:, :, 0] = (xx * 255 // max(1, width - 1)).astype(np.uint8)
+    logo[:, :, 1] = 200
+    logo[:, :, 2] = (yy * 255 // max(1, height - 1)).astype(np.uint8)
+
+    if pattern == 'opaque':
+        alpha = np.full((height, width), 255)
+    elif pattern == 'gradient':
+        alpha = xx * 255 // max(1, width - 1)
+    elif pattern == 'binary':
+        alpha = np.where(((xx // 8) + (yy // 8)) % 2 == 0, 255, 0)
+    elif pattern == 'soft':
+        dist = np.hypot(xx - width / 2, yy - height / 2) / (min(width, height) / 2)
+        alpha = np.clip((1 - dist) * 255, 0, 255)
+    else:
+        raise ValueError(f"Unknown alpha pattern '{pattern}'")
+    logo[:, :, 3] = alpha.astype(np.uint8)
+    cv2.imwrite(path, logo)
+
+
+def _size_mb(path: str):
+    return round(os.path.getsize(path) / 2**20, 3) if os.path.exists(path) else None
+
+
+def run_stage(stage: str, video: str, logo: str, workdir: str, workers: int, reader: str = 'opencv') -> dict:
+    """Time one stage; runs in its own process so peak RSS is per stage."""
+    from utils.compression import FFmpegWriter, compress_video
+    from utils.decoder import open_video
+    from utils.layers import load_logo_overlay
+    from utils.watermark import add_moving_watermark_with_alpha
+
+    cap = open_video(video, reader)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    output = None
+
+    started = time.perf_counter()
+    if stage == 'decode':
+        frame = None
+        while True:
+            ret, frame = cap.read(frame) if frame is not None else cap.read()
+            if not ret:
+                break
+    elif stage in ('blend', 'encode'):
+        # Decode up front so only the stage itself is timed
+        decoded = []
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            decoded.append(frame)
+        overlay = load_logo_overlay(logo, height)
+        started = time.perf_counter()
+        if stage == 'blend':
+            for i, frame in enumerate(decoded):
+                overlay.blend_at(frame, (i * 5) % max(1, width - overlay.width), 0)
+        else:
+            output = os.path.join(workdir, 'encode.mp4')
+            out = FFmpegWriter(output, (width, height), fps, preset='veryfast')
+            for frame in decoded:
+                out.write(frame)
+            out.release()
+    elif stage == 'pipeline':
+        output = os.path.join(workdir, 'pipeline.mp4')
+        add_moving_watermark_with_alpha(
+            video, logo, output, compress=True, workers=workers, preset='veryfast', reader=reader
+        )
+    elif stage == 'compress':
+        intermediate = os.path.join(workdir, 'intermediate.mp4')
+        add_moving_watermark_with_alpha(video, logo, intermediate, workers=workers, reader=reader)
+        output = os.path.join(workdir, 'compressed.mp4')
+        started = time.perf_counter()
+        compress_video(intermediate, output, preset='veryfast')
+    else:
+        raise ValueError(f"Unknown stage '{stage}'")
+    seconds = time.perf_counter() - started
+    cap.release()
+
+    return {
+        'seconds': round(seconds, 4),
+        'frames': frames,
+        'fps': round(frames / seconds, 2) if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_mb': _size_mb(output) if output else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(profile: str, seconds: float, stages: tuple, workers: int, reader: str = 'opencv') -> dict:
+    config = PROFILES[profile]
+    results = []
+    with tempfile.TemporaryDirectory(prefix='watermark-bench-') as tmp:
+        for resolution, fps, audio in itertools.product(
+            config['resolutions'], config['frame_rates'], config['audio']
+        ):
+            video = os.path.join(tmp, f'{resolution}_{fps}_{"audio" if audio else "silent"}.mp4')
+            make_video(video, resolution, fps, seconds, audio)
+
+            for logo_size, pattern in config['logos']:
+                logo = os.path.join(tmp, f'logo_{logo_size}_{pattern}.png')
+                if not os.path.exists(logo):
+                    make_logo(logo, logo_size, pattern)
+
+                case = {
+                    'resolution': resolution, 'fps': fps, 'audio': audio,
+                    'logo': logo_size, 'alpha': pattern, 'stages': {},
+                }
+                for stage in stages:
+                    workdir = tempfile.mkdtemp(dir=tmp)
+                    # A fresh process per stage keeps peak RSS and caches honest
+                    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                        case['stages'][stage] = pool.submit(
+                            run_stage, stage, video, logo, workdir, workers, reader
+                        ).result()
+                    print(f"{resolution} {fps}fps {'audio' if audio else 'silent'} "
+                          f"logo={logo_size}/{pattern} {stage:<8} "
+                          f"{case['stages'][stage]['fps']} fps", flush=True)
+                results.append(case)
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'profile': profile,
+        'seconds_per_video': seconds,
+        'workers': workers,
+        'reader': reader,
+        'results': results,
+    }
+
+
+def _case_key(case: dict) -> tuple:
+    return (case['resolution'], case['fps'], case['audio'], case['logo'], case['alpha'])
+
+
+def compare(current: dict, baseline: dict):
+    """Print the fps change of every stage present in both result files."""
+    previous = {_case_key(case): case for case in baseline['results']}
+    print(f"\nfps change vs {baseline.get('commit') or 'baseline'}:")
+    for case in current['results']:
+        old = previous.get(_case_key(case))
+        if not old:
+            continue
+        for stage, result in case['stages'].items():
+            old_fps = old['stages'].get(stage, {}).get('fps')
+            if old_fps and result['fps']:
+                change = (result['fps'] - old_fps) / old_fps * 100
+                print(f"  {' '.join(map(str, _case_key(case)))} {stage:<8} "
+                      f"{old_fps:>8.1f} -> {result['fps']:>8.1f} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=PROFILES, default='quick')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Length of each synthetic video')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--workers', type=int, default=None, help='Blend threads for pipeline stages')
+    parser.add_argument('--reader', choices=('opencv', 'ffmpeg'), default='opencv',
+                        help='Frame source for the decode and pipeline stages')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    results = run(args.profile, args.seconds, tuple(args.stages), args.workers, args.reader)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Benchmark how long the entry points take to start.
+
+Each case runs in a fresh interpreter (or a fresh frozen executable) and is
+timed from launch to exit:
+
+    version        cli.py --version
+    help           cli.py --help
+    probe          cli.py --probe on a short synthetic video
+    gui-import     importing gui.app (what main.py does before the window)
+    gui-window     building the Tk window and drawing it once (needs a display)
+    opencv-import  import cv2, the cost the lazy imports avoid, for reference
+
+With --exe, the same commands also run against a console PyInstaller build
+(the lean profile's VideoWatermarkerCLI, see add_watermarking.spec), so the
+one-file unpacking and the spec profiles can be compared. A windowed build
+prints nothing on Windows, so exe cases without output are reported as
+errors instead of being timed. Python cases also list which of NumPy, OpenCV and Pillow they
+imported; none of them should for anything but opencv-import.
+
+    python benchmarks/startup.py --output startup.json
+    python benchmarks/startup.py --exe dist/VideoWatermarker/VideoWatermarkerCLI --output new.json --compare startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+CLI = os.path.join(SRC, 'cli.py')
+HEAVY_MODULES = ('cv2', 'numpy', 'PIL')
+
+GUI_WINDOW = (
+    "import sys; sys.path.insert(0, {src!r}); import tkinter as tk; from gui.app import VideoWatermarkerApp; "
+    "root = tk.Tk(); VideoWatermarkerApp(root); root.update(); root.destroy()"
+)
+
+
+def make_video(path: str):
+    """Generate a one-second H.264 test video with FFmpeg's testsrc2."""
+    subprocess.run([
+        'ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=640x360:rate=30:duration=1',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', path
+    ], check=True)
+
+
+def python_cases(video: str) -> dict:
+    return {
+        'version': [sys.executable, CLI, '--version'],
+        'help': [sys.executable, CLI, '--help'],
+        'probe': [sys.executable, CLI, '--probe', video],
+        'gui-import': [sys.executable, '-c', f'import sys; sys.path.insert(0, {SRC!r}); import gui.app'],
+        'gui-window': [sys.executable, '-c', GUI_WINDOW.format(src=SRC)],
+        'opencv-import': [sys.executable, '-c', 'import cv2'],
+    }
+
+
+def exe_cases(exe: str, video: str) -> dict:
+    return {
+        'exe-version': [exe, '--version'],
+        'exe-probe': [exe, '--probe', video],
+    }
+
+
+def heavy_imports(cmd: list) -> list:
+    """Top-level heavy packages a Python command imports, from -X importtime."""
+    proc = subprocess.run(
+        [cmd[0], '-X', 'importtime'] + cmd[1:],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    found = re.findall(r'\|\s+([\w.]+)\s*$', proc.stderr, re.MULTILINE)
+    return sorted({name.split('.')[0] for name in found} & set(HEAVY_MODULES))
+
+
+def time_case(cmd: list, repeat: int, needs_output: bool = False) -> dict:
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - started
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()
+            return {'error': error[-1] if error else f'exit code {proc.returncode}'}
+        if needs_output and not proc.stdout.strip():
+            return {'error': 'printed nothing; is it a windowed build? Use VideoWatermarkerCLI'}
+        seconds.append(elapsed)
+    # The first run pays for cold file caches; the rest show a warm start
+    return {
+        'first': round(seconds[0], 4),
+        'median': round(statistics.median(seconds[1:] or seconds), 4),
+        'min': round(min(seconds), 4),
+        'error': None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat: int, exe: str = None) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='watermark-startup-') as tmp:
+        video = os.path.join(tmp, 'probe.mp4')
+        make_video(video)
+
+        cases = python_cases(video)
+        if exe:
+            cases.update(exe_cases(exe, video))
+        for name, cmd in cases.items():
+            result = time_case(cmd, repeat, needs_output=name.startswith('exe-'))
+            if cmd[0] == sys.executable and not result['error']:
+                result['heavy_modules'] = heavy_imports(cmd)
+            results[name] = result
+            if result['error']:
+                print(f"{name:<14} skipped: {result['error']}", flush=True)
+            else:
+                heavy = ', '.join(result.get('heavy_modules') or []) or '-'
+                print(f"{name:<14} first {result['first']:.3f}s  median {result['median']:.3f}s  "
+                      f"heavy imports: {heavy}", flush=True)
+
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'exe': exe,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(current: dict, baseline: dict):
+    """Print the median start time change of every case present in both result files."""
+    print(f"\nStartup change vs {baseline.get('commit') or 'baseline'}:")
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name, {})
+        if result.get('median') and old.get('median'):
+            change = (result['median'] - old['median']) / old['median'] * 100
+            print(f"  {name:<14} {old['median']:.3f}s -> {result['median']:.3f}s ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per case')
+    parser.add_argument('--exe', help='Also time this PyInstaller build')
+    parser.add_argument('--output', default='startup_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    results = run(max(1, args.repeat), args.exe)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+
+# NumPy, OpenCV and Pillow are only imported once processing starts (by
+# batch workers and run_fanout), so --version, --help, --probe and usage
+# errors answer without loading them
+from utils.batch import collect_inputs, output_path_for, run_batch
+from utils.jobs import JobQueue
+from utils.media_info import MediaInfo, get_media_info_cache
+from utils.memory import peak_rss_mb
+from utils.options import (
+    BACKENDS, CACHE_DIR_ENV, INTERPOLATION_NAMES, MOTIONS, PRESETS, RATE_CONTROLS, READERS
+)
+from utils.progress import configure_logging, log_progress
+from version import __version__
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+
+def frame_size(value: str) -> tuple:
+    """argparse type for 'WIDTHxHEIGHT'."""
+    try:
+        width, height = (int(n) for n in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got '{value}'")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"size must be positive, got '{value}'")
+    return (width, height)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='VideoWatermarker',
+        description='Add a moving watermark to one or many videos without the GUI.'
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='Video files, directories, glob patterns or manifest files (.txt/.json)')
+    parser.add_argument('--logo', help='Watermark image (PNG with transparency recommended); required '
+                                       'unless --probe')
+    parser.add_argument('--probe', action='store_true',
+                        help='Only print the inputs\' media info (size, fps, frames, codecs, rotation) as JSON')
+    parser.add_argument('-o', '--output', help='Output file (single input only)')
+    parser.add_argument('--output-dir', help='Directory for outputs (default: next to each input)')
+    parser.add_argument('--suffix', default='_watermarked', help='Suffix added to output file names')
+
+    settings = parser.add_argument_group('watermark settings')
+    settings.add_argument('--scale', type=float, default=0.08, help='Logo height relative to video height')
+    settings.add_argument('--speed', type=float, default=5.0, help='Movement speed in pixels per frame')
+    settings.add_argument('--opacity', type=float, default=0.25, help='Logo opacity (0.0 to 1.0)')
+    settings.add_argument('--motion', choices=MOTIONS, default='bounce', help='Motion pattern')
+    settings.add_argument('--backend', choices=BACKENDS, default='opencv',
+                          help="opencv blends in Python; ffmpeg uses FFmpeg's overlay filter "
+                               "(bounce, diagonal and corners motion only)")
+    settings.add_argument('--layers', metavar='FILE',
+                          help='JSON list of extra image/text layers drawn above the logo in the same pass, '
+                               'e.g. [{"type": "text", "text": "ID 42", "motion": "corners"}]')
+    settings.add_argument('--reader', choices=READERS, default='opencv',
+                          help='Frame decoder for the opencv backend: cv2.VideoCapture or an '
+                               'FFmpeg rawvideo pipe with --decode-threads threads')
+    settings.add_argument('--skip-static', action='store_true',
+                          help='For screen recordings and slides: reuse blended pixels while nothing under '
+                               'the logo changes and drop duplicate frames before encoding (variable frame rate)')
+
+    geometry = parser.add_argument_group('output size')
+    geometry.add_argument('--output-height', type=int,
+                          help='Downscale to this height before blending, e.g. 720 (never upscales); '
+                               '--scale is then relative to it')
+    geometry.add_argument('--max-size', type=frame_size, metavar='WxH',
+                          help='Downscale to fit within WIDTHxHEIGHT, keeping the aspect ratio')
+    geometry.add_argument('--interpolation', choices=INTERPOLATION_NAMES, default='area',
+                          help='Downscaling filter')
+
+    compression = parser.add_argument_group('compression')
+    compression.add_argument('--no-compress', action='store_true', help='Write mp4v without FFmpeg compression')
+    compression.add_argument('--target-size', type=float, default=10.0,
+                             help='Target file size in MB (abr and two-pass)')
+    compression.add_argument('--quality', type=int, default=23,
+                             help='CRF value (0-51, lower is better quality; crf only)')
+    compression.add_argument('--rate-control', choices=RATE_CONTROLS, default='crf',
+                             help='crf: constant quality; abr: single-pass bitrate with VBV caps; '
+                                  'two-pass: most accurate size')
+    compression.add_argument('--preset', choices=PRESETS, default='slow', help='x264 preset')
+
+    workers = parser.add_argument_group('workers')
+    workers.add_argument('-j', '--jobs', type=int, default=1, help='Videos processed at the same time')
+    workers.add_argument('--threads', type=int, default=None,
+                         help='Blend threads per video (default: cores divided by jobs)')
+    workers.add_argument('--decode-threads', type=int, default=0,
+                         help='FFmpeg decoder threads per video with --reader ffmpeg (default: auto)')
+    workers.add_argument('--segments', type=int, metavar='N',
+                         help='Split each video at keyframes into N segments rendered by --threads processes '
+                              'and joined without re-encoding (opencv backend, crf or abr); with --queue a '
+                              'rerun after a crash keeps the finished segments')
+    workers.add_argument('--memory-budget', type=float, metavar='MB',
+                         help='Peak memory for the whole run, FFmpeg included: frame buffers, blend threads, '
+                              'x264 lookahead, encoders and parallel jobs are scaled down to fit')
+
+    fanout = parser.add_argument_group('per-recipient fan-out')
+    fanout.add_argument('--recipients', metavar='FILE',
+                        help='IDs (.txt, one per line) or a .json list; decodes the single input once '
+                             'and writes one copy per recipient with their ID drawn in')
+    fanout.add_argument('--recipient-text', default='{id}', help='Text drawn for each recipient')
+    fanout.add_argument('--max-encoders', type=int, default=4,
+                        help='Recipient encoders running at once (each extra group decodes again)')
+
+    parser.add_argument('--logo-cache', metavar='DIR',
+                        help='Store prepared logos here so later runs and workers reuse them')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Do not log per-frame progress (JSON lines on stderr)')
+    parser.add_argument('--summary', help='Write a JSON summary of results and timings to this file')
+    parser.add_argument('--queue', metavar='DB',
+                        help='Record jobs in this SQLite file; rerunning with it skips finished videos '
+                             '(and copies identical ones rendered elsewhere) and retries the rest')
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print('No input videos found', file=sys.stderr)
+        return EXIT_USAGE
+    if args.probe:
+        return run_probe(inputs)
+    if not args.logo:
+        parser.error('--logo is required unless --probe is given')
+    if args.output and len(inputs) > 1:
+        print('--output can only be used with a single input; use --output-dir', file=sys.stderr)
+        return EXIT_USAGE
+    if not os.path.isfile(args.logo):
+        print(f'Logo not found: {args.logo}', file=sys.stderr)
+        return EXIT_USAGE
+
+    layers = None
+    if args.layers:
+        try:
+            with open(args.layers, encoding='utf-8') as f:
+                layers = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f'Cannot read layers from {args.layers}: {e}', file=sys.stderr)
+            return EXIT_USAGE
+        if not isinstance(layers, list):
+            print(f'{args.layers} must contain a JSON list of layers', file=sys.stderr)
+            return EXIT_USAGE
+
+    if args.logo_cache:
+        # Worker processes inherit the environment, so they share the store
+        os.environ[CACHE_DIR_ENV] = args.logo_cache
+
+    jobs = max(1, args.jobs)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // jobs)
+    params = {
+        'speed': args.speed,
+        'scale': args.scale,
+        'opacity': args.opacity,
+        'compress': not args.no_compress,
+        'quality': args.quality,
+        'target_size_mb': args.target_size,
+        'rate_control': args.rate_control,
+        'preset': args.preset,
+        'workers': threads,
+        'motion': args.motion,
+        'backend': args.backend,
+        'reader': args.reader,
+        'decode_threads': args.decode_threads,
+        'layers': layers,
+        'skip_static': args.skip_static,
+        'output_height': args.output_height,
+        'max_size': args.max_size,
+        'interpolation': args.interpolation,
+        'segments': args.segments,
+    }
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.segments and (args.rate_control == 'two-pass' or args.skip_static
+                          or args.no_compress or args.backend == 'ffmpeg'):
+        print('--segments cannot be combined with --rate-control two-pass, --skip-static, '
+              '--no-compress or --backend ffmpeg', file=sys.stderr)
+        return EXIT_USAGE
+    if args.recipients:
+        if len(inputs) > 1 or args.output:
+            print('--recipients takes a single input and --output-dir instead of --output', file=sys.stderr)
+            return EXIT_USAGE
+        return run_fanout(args, inputs[0], params)
+
+    tasks = []
+    for path in inputs:
+        if args.output:
+            output = args.output
+        else:
+            output = output_path_for(path, args.output_dir or os.path.dirname(path), args.suffix)
+        tasks.append({
+            'input_video_path': path,
+            'output_video_path': output,
+            'logo_path': args.logo,
+            'params': params,
+            'log_progress': not args.quiet,
+        })
+
+    def report(result, done, total):
+        line = f"[{done}/{total}] {result['status']:<7} {result['input']} ({result['seconds']:.1f}s)"
+        if result['error']:
+            line += f" - {result['error']}"
+        print(line, flush=True)
+
+    queue = JobQueue(args.queue) if args.queue else None
+    try:
+        summary = run_batch(tasks, jobs=jobs, on_result=report, queue=queue, memory_budget_mb=args.memory_budget)
+    finally:
+        if queue:
+            queue.close()
+    print(f"Done: {summary['succeeded']} ok ({summary['skipped']} skipped), "
+          f"{summary['failed']} failed in {summary['wall_seconds']:.1f}s{peak_memory_text(summary['peak_rss_mb'])}")
+
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+    return EXIT_FAILED if summary['failed'] else EXIT_OK
+
+
+def peak_memory_text(peak: dict) -> str:
+    if peak['self'] is None:
+        return ''
+    return f", peak memory {peak['self']:.0f}MB (largest child process {peak['children']:.0f}MB)"
+
+
+def run_probe(inputs: list) -> int:
+    infos = get_media_info_cache().probe_many(inputs)
+    report = [
+        info.to_dict() if isinstance(info, MediaInfo) else {'path': path, 'error': str(info)}
+        for path, info in infos.items()
+    ]
+    print(json.dumps(report, indent=2))
+    return EXIT_FAILED if any('error' in entry for entry in report) else EXIT_OK
+
+
+def run_fanout(args, input_video_path: str, params: dict) -> int:
+    from utils.fanout import add_watermarks_fanout, read_recipients
+
+    base_name = os.path.splitext(os.path.basename(input_video_path))[0] + args.suffix
+    try:
+        recipients = read_recipients(
+            args.recipients, args.output_dir or os.path.dirname(input_video_path),
+            base_name, args.recipient_text
+        )
+    except (OSError, ValueError, KeyError) as e:
+        print(f'Cannot read recipients from {args.recipients}: {e}', file=sys.stderr)
+        return EXIT_USAGE
+    if not recipients:
+        print(f'No recipients in {args.recipients}', file=sys.stderr)
+        return EXIT_USAGE
+
+    progress = None
+    if not args.quiet:
+        configure_logging()
+        progress = partial(log_progress, job=input_video_path)
+
+    started = time.perf_counter()
+    results = add_watermarks_fanout(
+        input_video_path, args.logo, recipients,
+        speed=params['speed'], scale=params['scale'], opacity=params['opacity'],
+        quality=params['quality'], motion=params['motion'],
+        target_size_mb=params['target_size_mb'], rate_control=params['rate_control'],
+        preset=params['preset'], layers=params['layers'], max_encoders=args.max_encoders,
+        progress=progress, reader=params['reader'], decode_threads=params['decode_threads'],
+        output_height=params['output_height'], max_size=params['max_size'],
+        interpolation=params['interpolation'], memory_budget_mb=args.memory_budget
+    )
+    for done, result in enumerate(results, 1):
+        line = f"[{done}/{len(results)}] {result['status']:<7} {result['output']}"
+        if result['error']:
+            line += f" - {result['error']}"
+        print(line, flush=True)
+
+    failed = [r for r in results if r['status'] != 'ok']
+    summary = {
+        'input': input_video_path,
+        'total': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'max_encoders': args.max_encoders,
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results,
+    }
+    print(f"Done: {summary['succeeded']} ok, {summary['failed']} failed in {summary['wall_seconds']:.1f}s"
+          f"{peak_memory_text(summary['peak_rss_mb'])}")
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
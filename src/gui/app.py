@@ -1,9 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-import os
-from utils.watermark import add_moving_watermark_with_alpha
-from utils.compression import compress_video
+from utils.options import BACKENDS, RATE_CONTROLS, PRESETS
+from utils.cancellation import CancelToken, ProcessingCancelled
+from utils.jobs import atomic_output
+
+# OpenCV, NumPy and Pillow load on first preview or on Start, on a worker
+# thread, so the window appears without waiting for them
 
 class VideoWatermarkerApp:
     def __init__(self, root):
@@ -19,9 +22,23 @@ class VideoWatermarkerApp:
         self.opacity_value = tk.DoubleVar(value=0.25)
         self.target_size = tk.DoubleVar(value=10.0)
         self.quality_value = tk.IntVar(value=23)
+        self.rate_control = tk.StringVar(value='crf')
+        self.preset = tk.StringVar(value='slow')
+        self.backend = tk.StringVar(value='opencv')
         self.should_cancel = False
+        # Number of the running job; progress from any other job is ignored
+        self.job = 0
+        self.active_job = None
         self.enable_compression = tk.BooleanVar(value=True)
 
+        # Preview: a few seconds decoded once at low resolution, re-blended
+        # with the current slider values every frame (created on first use)
+        self.preview = None
+        self.preview_video = None
+        self.preview_photo = None
+        self.preview_index = 0
+        self.preview_playing = False
+
         # UI setup
         self.create_widgets()
 
@@ -32,6 +49,9 @@ class VideoWatermarkerApp:
         # Settings section
         self.create_settings_section()
 
+        # Preview section
+        self.create_preview_section()
+
         # Progress bar
         self.progress = ttk.Progressbar(self.root, length=400, mode='determinate')
         self.progress.pack(pady=10)
@@ -92,6 +112,19 @@ class VideoWatermarkerApp:
         self.create_slider(settings_frame, "Target Size (MB):", self.target_size, 4, 10.0, 1000.0, 10, slider_name="target_size_scale")
         self.create_slider(settings_frame, "Quality (0-51):", self.quality_value, 5, 0, 51, 1, slider_name="quality_scale")
 
+        # Rate control: CRF ignores the target size, ABR/two-pass aim for it
+        tk.Label(settings_frame, text="Rate Control:").grid(row=6, column=0, sticky=tk.W)
+        self.rate_control_box = ttk.Combobox(settings_frame, textvariable=self.rate_control, values=RATE_CONTROLS, state="readonly", width=12)
+        self.rate_control_box.grid(row=6, column=1, sticky=tk.W, padx=5)
+
+        tk.Label(settings_frame, text="Preset:").grid(row=7, column=0, sticky=tk.W)
+        self.preset_box = ttk.Combobox(settings_frame, textvariable=self.preset, values=PRESETS, state="readonly", width=12)
+        self.preset_box.grid(row=7, column=1, sticky=tk.W, padx=5)
+
+        # Engine: 'ffmpeg' keeps frames out of Python entirely
+        tk.Label(settings_frame, text="Engine:").grid(row=8, column=0, sticky=tk.W)
+        ttk.Combobox(settings_frame, textvariable=self.backend, values=BACKENDS, state="readonly", width=12).grid(row=8, column=1, sticky=tk.W, padx=5)
+
         # # Target Size
         # ttk.Label(settings_frame, text="Target Size (MB):").grid(row=4, column=0, sticky=tk.W)
         # self.target_size_scale = ttk.Scale(settings_frame, from_=1, to=100, variable=self.target_size, orient=tk.HORIZONTAL)
@@ -105,10 +138,102 @@ class VideoWatermarkerApp:
         # Initially enable/disable based on toggle
         self.toggle_compression_settings()
 
+    def create_preview_section(self):
+        frame = ttk.LabelFrame(self.root, text="Preview")
+        frame.pack(padx=10, pady=10, fill="x")
+
+        self.preview_label = ttk.Label(frame, text="Select a video and logo, then click Preview", anchor="center")
+        self.preview_label.pack(padx=5, pady=5)
+        self.preview_button = ttk.Button(frame, text="Preview", command=self.toggle_preview)
+        self.preview_button.pack(pady=(0, 5))
+
+        # Redraw the paused frame as soon as a slider moves
+        for var in (self.scale_value, self.speed_value, self.opacity_value):
+            var.trace_add("write", lambda *args: self.refresh_preview())
+
+    def toggle_preview(self):
+        if self.preview_playing:
+            self.stop_preview()
+            return
+        if not all([self.input_video_path.get(), self.logo_path.get()]):
+            messagebox.showerror("Error", "Please select an input video and a logo.")
+            return
+
+        video = self.input_video_path.get()
+        self.preview_button.config(state=tk.DISABLED)
+        self.preview_label.config(text="Loading preview...", image="")
+        threading.Thread(target=self._load_preview_thread, args=(video,), daemon=True).start()
+
+    def _load_preview_thread(self, video):
+        # Decoding takes a moment; the cached clip makes later frames instant
+        try:
+            if self.preview is None:
+                from utils.preview import PreviewRenderer
+                self.preview = PreviewRenderer(max_width=480)
+            self.preview.clip(video)
+        except Exception as e:
+            self.root.after(0, self.preview_failed, e)
+            return
+        self.root.after(0, self.start_preview, video)
+
+    def start_preview(self, video):
+        self.preview_video = video
+        self.preview_index = 0
+        self.preview_playing = True
+        self.preview_button.config(text="Pause", state=tk.NORMAL)
+        self._preview_tick()
+
+    def stop_preview(self):
+        self.preview_playing = False
+        self.preview_button.config(text="Preview", state=tk.NORMAL)
+
+    def preview_failed(self, error):
+        self.stop_preview()
+        self.preview_photo = None
+        self.preview_label.config(text=f"Preview error: {error}", image="")
+
+    def _preview_tick(self):
+        if not self.preview_playing:
+            return
+        if self.show_preview_frame():
+            self.preview_index += 1
+            fps = self.preview.clip(self.preview_video).fps
+            self.root.after(max(1, int(1000 / fps)), self._preview_tick)
+
+    def refresh_preview(self):
+        if not self.preview_playing and self.preview_photo is not None:
+            self.show_preview_frame()
+
+    def show_preview_frame(self):
+        import cv2
+        from PIL import Image, ImageTk
+
+        try:
+            frame = self.preview.render(
+                self.preview_video, self.logo_path.get(), self.preview_index,
+                scale=self.scale_value.get(),
+                speed=self.speed_value.get(),
+                opacity=self.opacity_value.get()
+            )
+        except Exception as e:
+            self.preview_failed(e)
+            return False
+
+        image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if self.preview_photo is None or (self.preview_photo.width(), self.preview_photo.height()) != image.size:
+            self.preview_photo = ImageTk.PhotoImage(image)
+            self.preview_label.config(image=self.preview_photo, text="")
+        else:
+            self.preview_photo.paste(image)
+        return True
+
     def toggle_compression_settings(self):
         state = "normal" if self.enable_compression.get() else "disabled"
         self.target_size_scale.configure(state=state)
         self.quality_scale.configure(state=state)
+        combo_state = "readonly" if self.enable_compression.get() else "disabled"
+        self.rate_control_box.configure(state=combo_state)
+        self.preset_box.configure(state=combo_state)
 
     # def create_slider(self, parent, label, variable, row, min_val, max_val, step):
     #     tk.Label(parent, text=label).grid(row=row, column=0, sticky=tk.W)
@@ -143,56 +268,100 @@ class VideoWatermarkerApp:
             return
 
         self.should_cancel = False
+        self.cancel_token = CancelToken()
+        # Leave the CPU to the render
+        if self.preview_playing:
+            self.stop_preview()
         self.progress["value"] = 0
         self.progress_label.config(text="Starting...")
 
         self.start_button.config(state=tk.DISABLED)
         self.cancel_button.config(state=tk.NORMAL)
 
-        threading.Thread(target=self._process_video_thread).start()
+        # Tk variables are read here, on the Tk thread, not by the worker
+        settings = dict(
+            input_video_path=self.input_video_path.get(),
+            logo_path=self.logo_path.get(),
+            speed=self.speed_value.get(),
+            scale=self.scale_value.get(),
+            opacity=self.opacity_value.get(),
+            compress=self.enable_compression.get(),
+            quality=self.quality_value.get(),
+            target_size_mb=self.target_size.get(),
+            rate_control=self.rate_control.get(),
+            preset=self.preset.get(),
+            backend=self.backend.get(),
+        )
+        self.job += 1
+        self.active_job = self.job
+        threading.Thread(
+            target=self._process_video_thread,
+            args=(self.job, settings, self.output_video_path.get(), self.cancel_token)
+        ).start()
 
     def cancel_processing(self):
         self.should_cancel = True
+        # Stops the frame loop within a few frames and kills FFmpeg right away
+        self.cancel_token.cancel()
         self.progress_label.config(text="Cancelling...")
 
-    def _process_video_thread(self):
+    def _process_video_thread(self, job, settings, output_video_path, cancel_token):
+        # Runs off the Tk thread, so every widget update goes through root.after
+        self.root.after(0, self.update_progress, 10, "Adding watermark...")
         try:
-            self.update_progress(10, "Adding watermark...")
-            add_moving_watermark_with_alpha(
-                input_video_path=self.input_video_path.get(),
-                logo_path=self.logo_path.get(),
-                output_video_path="temp_watermarked.mp4",
-                speed=self.speed_value.get(),
-                scale=self.scale_value.get(),
-                opacity=self.opacity_value.get()
-            )
-
-            if self.should_cancel:
-                raise Exception("Processing cancelled by user")
-
-            if self.enable_compression.get():
-                self.update_progress(50, "Compressing video...")
-                compress_video(
-                    input_video_path="temp_watermarked.mp4",
-                    output_video_path=self.output_video_path.get(),
-                    target_size_mb=self.target_size.get(),
-                    quality=self.quality_value.get()
+            from utils.watermark import add_moving_watermark_with_alpha
+
+            # With compression enabled the frames are piped straight into
+            # FFmpeg, so there is no intermediate file to re-encode. The
+            # output only appears, complete, once processing has finished.
+            with atomic_output(output_video_path) as partial_path:
+                add_moving_watermark_with_alpha(
+                    output_video_path=partial_path,
+                    progress=lambda report: self.on_progress(job, report),
+                    cancel_token=cancel_token,
+                    **settings
                 )
-            else:
-                os.rename("temp_watermarked.mp4", self.output_video_path.get())
+            outcome = (100, "Done!")
+        except ProcessingCancelled:
+            outcome = (0, "Cancelled")
+        except Exception as e:
+            outcome = (None, f"Error: {str(e)}")
+        self.root.after(0, self.finish_processing, job, *outcome)
 
-            self.update_progress(100, "Done!")
+    def on_progress(self, job, report):
+        # Called from the processing thread; Tk must be updated on its own thread
+        self.root.after(0, self.show_progress, job, report)
 
-        except Exception as e:
-            self.progress_label.config(text=f"Error: {str(e)}")
-        finally:
-            self.start_button.config(state=tk.NORMAL)
-            self.cancel_button.config(state=tk.DISABLED)
+    def show_progress(self, job, report):
+        # A snapshot that arrives after its job finished (e.g. the final
+        # one) must not overwrite "Done!" or "Cancelled"
+        if self.should_cancel or job != self.active_job:
+            return
+        text = f"{report['stage'].capitalize()}: {report['frames_done']}"
+        if report['total_frames']:
+            text += f"/{report['total_frames']}"
+        text += f" frames, {report['fps']:.1f} fps"
+        if report['eta_seconds'] is not None:
+            minutes, seconds = divmod(int(report['eta_seconds']), 60)
+            text += f", ETA {minutes}:{seconds:02d}"
+        if report['stage_seconds']:
+            stages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in report['stage_seconds'].items())
+            text += f"\n({stages})"
+        self.progress["value"] = (report['fraction'] or 0) * 100
+        self.progress_label.config(text=text)
+
+    def finish_processing(self, job, value, text):
+        if job != self.active_job:
+            return
+        self.active_job = None
+        self.update_progress(value, text)
+        self.start_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
 
     def update_progress(self, value, text):
-        self.progress["value"] = value
+        if value is not None:
+            self.progress["value"] = value
         self.progress_label.config(text=text)
-        self.root.update_idletasks()
 
     def create_branding_section(self):
         # Subtle branding at the bottom of the window
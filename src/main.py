@@ -1,7 +1,16 @@
-import tkinter as tk
-from gui.app import VideoWatermarkerApp
+import sys
+
 
 def main():
+    # Any command-line arguments mean a headless run; render servers may
+    # not have Tk (or a display) at all, so the GUI is only imported here.
+    if len(sys.argv) > 1:
+        from cli import main as cli_main
+        sys.exit(cli_main())
+
+    import tkinter as tk
+    from gui.app import VideoWatermarkerApp
+
     root = tk.Tk()
     app = VideoWatermarkerApp(root)
     root.mainloop()
@@ -0,0 +1,218 @@
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from utils.jobs import JobQueue, atomic_output, segments_work_dir
+from utils.media_info import MediaInfo, get_media_info_cache
+from utils.memory import peak_rss_mb, plan_memory
+from utils.progress import configure_logging, log_progress
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+
+def collect_inputs(sources: list) -> list:
+    """
+    Expand input specifications into a sorted, de-duplicated list of videos.
+
+    Each source may be a video file, a directory (searched recursively for
+    video files), a glob pattern, or a manifest: a .txt file with one path
+    per line (``#`` starts a comment) or a .json list of paths. Relative
+    manifest entries are resolved against the manifest's directory.
+    """
+    found = []
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                found += [
+                    os.path.join(root, name) for name in files
+                    if name.lower().endswith(VIDEO_EXTENSIONS)
+                ]
+        elif os.path.isfile(source) and source.lower().endswith(('.txt', '.json')):
+            found += _read_manifest(source)
+        elif os.path.isfile(source):
+            found.append(source)
+        else:
+            found += glob.glob(source, recursive=True)
+
+    seen = set()
+    inputs = []
+    for path in sorted(os.path.abspath(p) for p in found):
+        if path not in seen:
+            seen.add(path)
+            inputs.append(path)
+    return inputs
+
+
+def _read_manifest(manifest_path: str) -> list:
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding='utf-8') as f:
+        if manifest_path.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [line.split('#', 1)[0].strip() for line in f]
+    return [os.path.join(base, entry) for entry in entries if entry]
+
+
+def output_path_for(input_video_path: str, output_dir: str, suffix: str = '_watermarked') -> str:
+    """Output file for an input: <output_dir>/<name><suffix>.mp4"""
+    name = os.path.splitext(os.path.basename(input_video_path))[0]
+    return os.path.join(output_dir, f'{name}{suffix}.mp4')
+
+
+def process_one(task: dict) -> dict:
+    """
+    Watermark a single video and report how it went.
+
+    The video is rendered to a unique partial file next to the output and
+    renamed into place when finished, so concurrent jobs never share a
+    temporary file and a crash never leaves a truncated output behind.
+
+    Args:
+        task: Dict with input_video_path, output_video_path and params
+            (keyword arguments for add_moving_watermark_with_alpha); with
+            log_progress set, progress is written as structured log lines
+
+    Returns:
+        Dict with input, output, status ('ok' or 'failed'), error, the
+        encode size report, seconds and the worker's peak_rss_mb
+    """
+    # Imported by the process doing the work, so collecting and probing
+    # inputs never loads NumPy or OpenCV
+    from utils.watermark import add_moving_watermark_with_alpha
+
+    params = dict(task['params'])
+    if isinstance(task.get('media_info'), MediaInfo):
+        # Probed by run_batch, so this process doesn't run ffprobe again
+        get_media_info_cache().put(task['media_info'])
+    if task.get('log_progress'):
+        configure_logging()
+        params['progress'] = partial(log_progress, job=task['input_video_path'])
+
+    started = time.perf_counter()
+    result = {
+        'input': task['input_video_path'],
+        'output': task['output_video_path'],
+        'status': 'ok',
+        'error': None,
+        'encode': None,
+    }
+    try:
+        with atomic_output(task['output_video_path']) as partial_path:
+            result['encode'] = add_moving_watermark_with_alpha(
+                input_video_path=task['input_video_path'],
+                logo_path=task['logo_path'],
+                output_video_path=partial_path,
+                **params
+            )
+        if result['encode']:
+            result['encode']['output'] = task['output_video_path']
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def leanest_job_mb(task: dict) -> float:
+    """Estimated memory of a task run with the smallest plan_memory() settings."""
+    from utils.decoder import output_size
+
+    info = task.get('media_info')
+    if not isinstance(info, MediaInfo) or not info.has_video:
+        return 0.0
+    params = task['params']
+    size = output_size(info.width, info.height, params.get('output_height'), params.get('max_size'))
+    plan = plan_memory(
+        size, 1, 1, params.get('preset', 'slow'),
+        compress=params.get('compress', False), source_size=(info.width, info.height)
+    )
+    return plan['estimated_mb']
+
+
+def run_batch(tasks: list, jobs: int = 1, on_result=None, queue: JobQueue = None,
+              memory_budget_mb: float = None) -> dict:
+    """
+    Process tasks in a pool of ``jobs`` worker processes.
+
+    Args:
+        tasks: Task dicts as accepted by process_one()
+        jobs: Videos processed at the same time
+        on_result: Optional callback(result, done, total) after each video
+        queue: Optional JobQueue recording every job, so finished (or
+            identical) outputs are skipped with status 'skipped' and a
+            rerun after a crash only processes the rest; segmented jobs
+            also keep their finished segments (see segments_work_dir)
+        memory_budget_mb: Memory for the whole batch in MB. Fewer jobs run
+            at once if the largest video would not fit otherwise, and each
+            job gets an equal share as its ``memory_budget_mb``
+
+    Returns:
+        Summary dict with per-file results and aggregate timings
+    """
+    started = time.perf_counter()
+    results = []
+    total = len(tasks)
+    order = {task['input_video_path']: i for i, task in enumerate(tasks)}
+
+    def record(task, result):
+        if queue:
+            queue.finish(task, result)
+        results.append(result)
+        if on_result:
+            on_result(result, len(results), total)
+
+    if queue:
+        tasks, not_run = queue.plan(tasks)
+        for result in not_run:
+            results.append(result)
+            if on_result:
+                on_result(result, len(results), total)
+        for task in tasks:
+            queue.start(task)
+        # Segments finished before a crash are picked up again on the rerun
+        tasks = [
+            dict(task, params=dict(task['params'], work_dir=segments_work_dir(task['output_video_path'])))
+            if task['params'].get('segments') else task
+            for task in tasks
+        ]
+
+    # All inputs are probed at once up front; workers get the results with
+    # their task instead of each spawning ffprobe for the same facts
+    infos = get_media_info_cache().probe_many(task['input_video_path'] for task in tasks)
+    tasks = [dict(task, media_info=infos[task['input_video_path']]) for task in tasks]
+
+    if memory_budget_mb and tasks:
+        # The largest video at its leanest decides how many run side by side
+        leanest = max(leanest_job_mb(task) for task in tasks)
+        if leanest:
+            jobs = max(1, min(jobs, int(memory_budget_mb // leanest)))
+        share = memory_budget_mb / max(1, jobs)
+        tasks = [dict(task, params=dict(task['params'], memory_budget_mb=share)) for task in tasks]
+
+    if jobs <= 1:
+        for task in tasks:
+            record(task, process_one(task))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(process_one, task): task for task in tasks}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+
+    results.sort(key=lambda r: order[r['input']])
+    failed = [r for r in results if r['status'] == 'failed']
+    return {
+        'total': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'skipped': sum(r['status'] == 'skipped' for r in results),
+        'jobs': jobs,
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'file_seconds': round(sum(r['seconds'] for r in results), 3),
+        'memory_budget_mb': memory_budget_mb,
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results,
+    }
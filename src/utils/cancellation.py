@@ -0,0 +1,73 @@
+import os
+import subprocess
+import threading
+
+# Frame loops check the token this often; a check is just an Event lookup
+CANCEL_CHECK_FRAMES = 8
+
+
+class ProcessingCancelled(Exception):
+    """Raised inside a job once its CancelToken has been cancelled."""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation shared between the caller and a running job.
+
+    Frame loops poll it every few frames, and FFmpeg child processes
+    registered with it are terminated the moment cancel() is called, so a
+    cancelled job stops using CPU within about a second.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for proc in processes:
+            _terminate(proc)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise ProcessingCancelled("Processing cancelled by user")
+
+    def register(self, proc: subprocess.Popen):
+        """Terminate ``proc`` on cancel (immediately if already cancelled)."""
+        with self._lock:
+            self._processes.add(proc)
+        if self._event.is_set():
+            _terminate(proc)
+
+    def unregister(self, proc: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(proc)
+
+
+def _terminate(proc: subprocess.Popen):
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+
+    # Don't block the cancelling (often GUI) thread; escalate in the background
+    def kill_if_alive():
+        if proc.poll() is None:
+            proc.kill()
+
+    timer = threading.Timer(1.0, kill_if_alive)
+    timer.daemon = True
+    timer.start()
+
+
+def remove_partial_output(*paths: str):
+    """Delete files left behind by a cancelled or failed job."""
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
@@ -1,11 +1,311 @@
 import subprocess
 import os
+import tempfile
+
+import numpy as np
+
+from utils.cancellation import CancelToken, ProcessingCancelled, remove_partial_output
+from utils.media_info import probe_media
+from utils.options import PRESETS, RATE_CONTROLS
+from utils.progress import ProgressReporter, run_ffmpeg
+
+AUDIO_BITRATE_KBPS = 128
+
+# Audio codecs each output container can hold as-is; anything else is
+# re-encoded to AAC. Matroska takes every codec FFmpeg can demux.
+COPYABLE_AUDIO = {
+    '.mp4': {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'opus'},
+    '.m4v': {'aac', 'mp3', 'ac3', 'eac3', 'alac'},
+    '.mov': {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'pcm_s16le', 'pcm_s16be', 'pcm_s24le', 'pcm_s24be'},
+    '.avi': {'mp3', 'ac3', 'aac', 'pcm_s16le'},
+    '.mkv': None,
+}
+
+
+def target_video_bitrate(target_size_mb: float, duration: float, audio_kbps: int = AUDIO_BITRATE_KBPS) -> int:
+    """
+    Video bitrate (kbps) that lands the whole file on ``target_size_mb``
+    once ``audio_kbps`` of audio is added.
+    """
+    total_kbps = (target_size_mb * 8192) / duration  # 8192 = 8 * 1024 (MB to kbps)
+    return max(1, int(total_kbps - audio_kbps))
+
+
+def predicted_size_mb(rate_control: str, bitrate_kbps: int, duration: float,
+                      audio_kbps: int = AUDIO_BITRATE_KBPS):
+    """Expected output size in MB, or None for CRF where size depends on content."""
+    if rate_control == 'crf' or not bitrate_kbps:
+        return None
+    return (bitrate_kbps + audio_kbps) * duration / 8192
+
+
+def video_encoder_args(
+    rate_control: str = 'crf',
+    quality: int = 23,
+    bitrate_kbps: int = None,
+    preset: str = 'slow',
+    pass_number: int = None,
+    passlog: str = None,
+    lookahead: int = None
+) -> list:
+    """
+    libx264 arguments for an encode strategy.
+
+    Args:
+        rate_control: 'crf' (constant quality, unpredictable size), 'abr'
+            (single-pass average bitrate with VBV caps) or 'two-pass'
+            (bitrate-targeted, most accurate size)
+        quality: CRF value (0-51, lower is better quality), used by 'crf'
+        bitrate_kbps: Video bitrate, required by 'abr' and 'two-pass'
+        preset: x264 preset, trading encode time against compression
+        pass_number: 1 or 2 for 'two-pass'
+        passlog: Pass log file prefix for 'two-pass'
+        lookahead: Frames of x264 rate-control lookahead, or None for the
+            preset's; each one holds a frame in memory (see plan_memory)
+    """
+    if rate_control not in RATE_CONTROLS:
+        raise ValueError(f"Unknown rate control '{rate_control}'; choose from {RATE_CONTROLS}")
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown preset '{preset}'; choose from {PRESETS}")
+
+    args = ['-c:v', 'libx264', '-preset', preset]
+    if lookahead is not None:
+        args += ['-rc-lookahead', str(lookahead)]
+    if rate_control == 'crf':
+        return args + ['-crf', str(quality)]
+
+    if not bitrate_kbps:
+        raise ValueError(f"'{rate_control}' needs a target bitrate")
+    args += ['-b:v', f'{bitrate_kbps}k']
+    if rate_control == 'abr':
+        # VBV keeps short spikes from blowing past the size budget
+        return args + ['-maxrate', f'{bitrate_kbps}k', '-bufsize', f'{bitrate_kbps * 2}k']
+
+    if pass_number not in (1, 2):
+        raise ValueError("'two-pass' needs pass_number 1 or 2")
+    return args + ['-pass', str(pass_number), '-passlogfile', passlog]
+
+
+def probe_audio(path: str):
+    """
+    Codec and bitrate of the first audio stream in ``path``, or None if
+    it has none (or cannot be probed).
+
+    Returns:
+        {'codec': e.g. 'aac', 'bitrate_kbps': int or None if not stored}
+    """
+    try:
+        return probe_media(path).audio
+    except FileNotFoundError:
+        return None
+
+
+def audio_stream_args(audio_source_path: str, output_video_path: str) -> tuple:
+    """
+    FFmpeg audio codec arguments for carrying the source's audio into the
+    output: stream copy when the output container accepts the codec,
+    otherwise an AAC re-encode.
+
+    Returns:
+        (args, audio_kbps) where audio_kbps is the expected audio bitrate
+        for size targeting (0 when the source has no audio)
+    """
+    audio = probe_audio(audio_source_path) if audio_source_path else None
+    if audio is None:
+        return ['-an'], 0
+
+    copyable = COPYABLE_AUDIO.get(os.path.splitext(output_video_path)[1].lower(), set())
+    if copyable is None or audio['codec'] in copyable:
+        return ['-c:a', 'copy'], audio['bitrate_kbps'] or AUDIO_BITRATE_KBPS
+    return ['-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE_KBPS}k'], AUDIO_BITRATE_KBPS
+
+
+def size_target(input_video_path: str, output_video_path: str, rate_control: str,
+                target_size_mb: float, duration: float, audio_kbps: int = None) -> tuple:
+    """
+    Video bitrate for ``rate_control`` to land on ``target_size_mb``.
+
+    Returns:
+        (bitrate_kbps, audio_kbps); bitrate_kbps is None for 'crf', and
+        audio_kbps is probed from the input unless given
+    """
+    if rate_control == 'crf':
+        return None, audio_kbps or 0
+    if duration <= 0:
+        raise ValueError(f"Cannot target a size without a known duration: {input_video_path}")
+    if audio_kbps is None:
+        _, audio_kbps = audio_stream_args(input_video_path, output_video_path)
+    return target_video_bitrate(target_size_mb, duration, audio_kbps), audio_kbps
+
+
+def mux_audio(video_path: str, audio_source_path: str, output_video_path: str,
+              cancel_token: CancelToken = None):
+    """
+    Copy the video of ``video_path`` and the first audio stream of
+    ``audio_source_path`` into ``output_video_path`` without re-encoding
+    the video (and the audio only if the container requires it).
+    """
+    audio_args, _ = audio_stream_args(audio_source_path, output_video_path)
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error', '-i', video_path, '-i', audio_source_path,
+        '-map', '0:v:0', '-map', '1:a:0?', '-c:v', 'copy'
+    ] + audio_args + [output_video_path]
+    run_ffmpeg(cmd, cancel_token=cancel_token)
+
+
+def encode_report(output_video_path: str, rate_control: str, preset: str, predicted_mb) -> dict:
+    """Compare the encoded file's size against the prediction and print it."""
+    actual_mb = os.path.getsize(output_video_path) / (1024 * 1024)
+    report = {
+        'output': output_video_path,
+        'rate_control': rate_control,
+        'preset': preset,
+        'predicted_mb': round(predicted_mb, 3) if predicted_mb else None,
+        'actual_mb': round(actual_mb, 3),
+        'error_pct': None,
+    }
+    print(f"Final file size: {actual_mb:.2f}MB ({rate_control}, preset {preset})")
+    if predicted_mb:
+        report['error_pct'] = round((actual_mb - predicted_mb) / predicted_mb * 100, 2)
+        print(f"Predicted size: {predicted_mb:.2f}MB ({report['error_pct']:+.1f}%)")
+    return report
+
+
+class FFmpegWriter:
+    """
+    Drop-in replacement for cv2.VideoWriter that pipes raw BGR frames into
+    an FFmpeg process, so the video is encoded once with libx264 and the
+    source audio is muxed in during the same pass (stream-copied when the
+    container allows it, see audio_stream_args).
+
+    Args:
+        output_video_path: Path to save encoded video
+        frame_size: (width, height) of the frames that will be written
+        fps: Frame rate of the output video
+        audio_source_path: Optional file whose audio track is muxed in
+        quality: CRF value (0-51, lower is better quality)
+        preset: x264 preset
+        rate_control: 'crf', 'abr' or 'two-pass' (see video_encoder_args)
+        bitrate_kbps: Video bitrate for 'abr' and 'two-pass'
+        pass_number: 1 or 2 for 'two-pass'; pass 1 only writes the pass log
+        passlog: Pass log file prefix for 'two-pass'
+        cancel_token: Optional CancelToken that terminates FFmpeg on cancel
+        drop_duplicates: Let FFmpeg drop frames identical to the previous
+            kept one before encoding; the output then has variable frame
+            rate timestamps and each kept frame lasts until the next
+        lookahead: x264 rate-control lookahead frames (None: the preset's)
+        frame_count: Frames that will be written; with drop_duplicates it
+            keeps a trailing run of duplicates in the video's duration
+    """
+
+    def __init__(
+        self,
+        output_video_path: str,
+        frame_size: tuple,
+        fps: float,
+        audio_source_path: str = None,
+        quality: int = 23,
+        preset: str = 'slow',
+        rate_control: str = 'crf',
+        bitrate_kbps: int = None,
+        pass_number: int = None,
+        passlog: str = None,
+        cancel_token: CancelToken = None,
+        drop_duplicates: bool = False,
+        lookahead: int = None,
+        frame_count: int = None
+    ):
+        width, height = frame_size
+        self.cancel_token = cancel_token
+        self.output_video_path = output_video_path
+        self.frame_size = (int(width), int(height))
+
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{self.frame_size[0]}x{self.frame_size[1]}',
+            '-r', str(fps),
+            '-i', '-',
+        ]
+        video_args = video_encoder_args(
+            rate_control, quality, bitrate_kbps, preset, pass_number, passlog, lookahead
+        )
+        video_args += ['-pix_fmt', 'yuv420p']  # Widest player compatibility
+        if drop_duplicates:
+            # Zero thresholds: only frames that are identical after the
+            # yuv420p conversion the encoder sees anyway are dropped
+            filters = 'format=yuv420p,mpdecimate=hi=0:lo=0:frac=0'
+            if frame_count:
+                # A trailing run of duplicates would be cut from the video, so
+                # the last kept frame is cloned at the last frame's timestamp;
+                # the clone is discarded when that frame was kept anyway
+                filters += (
+                    f",tpad=stop=1:stop_mode=clone,setpts='min(PTS,{int(frame_count) - 1}/(FR*TB))'"
+                    ",select='isnan(prev_selected_pts)+gt(pts,prev_selected_pts)'"
+                )
+            video_args = ['-vf', filters, '-vsync', 'vfr'] + video_args
+
+        if pass_number == 1:
+            # The analysis pass only needs the video; its output is discarded
+            cmd += video_args + ['-an', '-f', 'null', os.devnull]
+        else:
+            audio_args, _ = audio_stream_args(audio_source_path, output_video_path)
+            if audio_source_path:
+                cmd += ['-i', audio_source_path, '-map', '0:v:0', '-map', '1:a:0?']
+            cmd += video_args + audio_args + [output_video_path]
+
+        # Stderr goes to a file rather than a pipe so a chatty FFmpeg can
+        # never block on a full pipe while we are blocked writing stdin.
+        self.error = None  # FFmpeg's error output, once released
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=self._stderr)
+        if cancel_token:
+            cancel_token.register(self._proc)
+
+    def isOpened(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def write(self, frame: np.ndarray):
+        if self._proc is None:
+            raise RuntimeError(f"FFmpeg encoder already closed: {self.error or 'released'}")
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError):
+            # FFmpeg quit early; release() raises for a failing exit code,
+            # but a refused output can still exit 0
+            self.release()
+            raise RuntimeError(f"FFmpeg stopped reading frames: {self.error}")
+
+    def release(self):
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        try:
+            proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        returncode = proc.wait()
+        if self.cancel_token:
+            self.cancel_token.unregister(proc)
+
+        self._stderr.seek(0)
+        error = self.error = self._stderr.read().decode('utf-8', errors='replace').strip()
+        self._stderr.close()
+        if self.cancel_token:
+            self.cancel_token.raise_if_cancelled()
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg encoding failed ({returncode}): {error}")
+
 
 def compress_video(
     input_video_path: str,
     output_video_path: str,
     target_size_mb: float = 10.0,
-    quality: int = 23
+    quality: int = 23,
+    rate_control: str = 'crf',
+    preset: str = 'slow',
+    progress=None,
+    cancel_token: CancelToken = None
 ):
     """
     Compress video while maintaining quality using FFmpeg.
@@ -13,36 +313,67 @@ def compress_video(
     Args:
         input_video_path: Path to input video
         output_video_path: Path to save compressed video
-        target_size_mb: Target file size in MB
-        quality: CRF value (0-51, lower is better quality)
+        target_size_mb: Target file size in MB, used by 'abr' and 'two-pass'
+        quality: CRF value (0-51, lower is better quality), used by 'crf'
+        rate_control: 'crf', 'abr' or 'two-pass' (see video_encoder_args)
+        preset: x264 preset
+        progress: Optional callback receiving ProgressReporter snapshots
+            parsed from FFmpeg's -progress output
+        cancel_token: Optional CancelToken; cancelling terminates FFmpeg,
+            removes the partial output and raises ProcessingCancelled
+
+    Returns:
+        Predicted versus actual size report, or None if FFmpeg failed
     """
-    # Get video duration using FFprobe
-    cmd = [
-        'ffprobe', '-v', 'error', '-show_entries',
-        'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
-        input_video_path
-    ]
-    duration = float(subprocess.check_output(cmd).decode('utf-8').strip())
-    
-    # Calculate target bitrate (in kbps)
-    target_bitrate = int((target_size_mb * 8192) / duration)  # 8192 = 8 * 1024 (MB to kbps)
+    # Size targets cover the whole file (same cached probe as audio_stream_args)
+    duration = probe_media(input_video_path).container_duration
     
-    # Use FFmpeg for compression
-    cmd = [
-        'ffmpeg', '-i', input_video_path,
-        '-c:v', 'libx264',  # Use H.264 codec
-        '-crf', str(quality),  # Constant Rate Factor (lower = better quality)
-        '-preset', 'slow',  # Slower preset = better compression
-        '-c:a', 'aac',  # Audio codec
-        '-b:a', '128k',  # Audio bitrate
-        output_video_path
-    ]
+    # Calculate target bitrate (in kbps), leaving room for the audio
+    audio_args, audio_kbps = audio_stream_args(input_video_path, output_video_path)
+    target_bitrate = target_video_bitrate(target_size_mb, duration, audio_kbps)
+    predicted_mb = predicted_size_mb(rate_control, target_bitrate, duration, audio_kbps)
+
+    # The same audio stream audio_stream_args() probed
+    streams = ['-map', '0:v:0', '-map', '0:a:0?']
+    passlog = os.path.splitext(output_video_path)[0] + '.passlog'
+    if rate_control == 'two-pass':
+        passes = [
+            ['ffmpeg', '-y', '-i', input_video_path]
+            + video_encoder_args(rate_control, quality, target_bitrate, preset, 1, passlog)
+            + ['-an', '-f', 'null', os.devnull],
+            ['ffmpeg', '-y', '-i', input_video_path] + streams
+            + video_encoder_args(rate_control, quality, target_bitrate, preset, 2, passlog)
+            + audio_args + [output_video_path],
+        ]
+    else:
+        passes = [
+            ['ffmpeg', '-y', '-i', input_video_path] + streams
+            + video_encoder_args(rate_control, quality, target_bitrate, preset)
+            + audio_args + [output_video_path]
+        ]
     
     try:
-        subprocess.run(cmd, check=True)
-        final_size_mb = os.path.getsize(output_video_path) / (1024 * 1024)
+        for i, cmd in enumerate(passes, 1):
+            stage = f'compress pass {i}/{len(passes)}' if len(passes) > 1 else 'compress'
+            reporter = ProgressReporter(progress, stage) if progress else None
+            run_ffmpeg(cmd, reporter, duration, cancel_token)
+            if reporter:
+                reporter.finish()
         print(f"\n✅ Video compressed successfully!")
-        print(f"Final file size: {final_size_mb:.2f}MB")
+        report = encode_report(output_video_path, rate_control, preset, predicted_mb)
         print(f"Saved to: {output_video_path}")
+        return report
     except subprocess.CalledProcessError as e:
-        print(f"Error during compression: {e}") 
\ No newline at end of file
+        print(f"Error during compression: {e}")
+    except ProcessingCancelled:
+        remove_partial_output(output_video_path)
+        raise
+    finally:
+        remove_pass_logs(passlog)
+
+
+def remove_pass_logs(passlog: str):
+    """Delete the x264 pass log files left behind by a two-pass encode."""
+    for suffix in ('-0.log', '-0.log.mbtree', '-0.log.temp', '-0.log.mbtree.temp'):
+        if os.path.exists(passlog + suffix):
+            os.remove(passlog + suffix)
@@ -0,0 +1,267 @@
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+from utils.cancellation import CancelToken
+from utils.media_info import probe_media
+from utils.options import READERS
+
+# Lines of FFmpeg's error output quoted when decoding fails
+STDERR_TAIL_LINES = 10
+
+# Output scaling filters (INTERPOLATION_NAMES): cv2 interpolation flag and FFmpeg scaler name
+INTERPOLATIONS = {
+    'area': (cv2.INTER_AREA, 'area'),
+    'linear': (cv2.INTER_LINEAR, 'bilinear'),
+    'cubic': (cv2.INTER_CUBIC, 'bicubic'),
+    'lanczos': (cv2.INTER_LANCZOS4, 'lanczos'),
+}
+
+
+def output_size(width: int, height: int, output_height: int = None, max_size: tuple = None) -> tuple:
+    """
+    Frame size after downscaling to ``output_height`` and/or to fit within
+    ``max_size`` (width, height), keeping the aspect ratio.
+
+    Never upscales. Scaled sizes are rounded to even numbers, as yuv420p
+    encoding needs.
+    """
+    factor = 1.0
+    if output_height:
+        factor = min(factor, output_height / height)
+    if max_size:
+        factor = min(factor, max_size[0] / width, max_size[1] / height)
+    if factor >= 1.0:
+        return (width, height)
+    return (max(2, int(round(width * factor / 2)) * 2), max(2, int(round(height * factor / 2)) * 2))
+
+
+class FFmpegReader:
+    """
+    Drop-in replacement for cv2.VideoCapture that decodes with an FFmpeg
+    subprocess and reads raw BGR frames from its stdout.
+
+    read(frame) fills ``frame`` in place with readinto(), so callers that
+    hand back a ring of buffers (like the watermark loops do) never
+    allocate per frame. FFmpeg decodes with ``threads`` threads and can
+    start and stop at any timestamp.
+
+    Args:
+        input_video_path: Path to input video
+        threads: Decoder threads (0 lets FFmpeg pick)
+        start: Optional start time in seconds (accurate seek)
+        end: Optional end time in seconds
+        cancel_token: Optional CancelToken that terminates FFmpeg on cancel
+        output_height: Optional height FFmpeg downscales frames to
+        max_size: Optional (width, height) FFmpeg downscales frames to fit
+        interpolation: Scaling filter, one of INTERPOLATIONS
+    """
+
+    def __init__(
+        self,
+        input_video_path: str,
+        threads: int = 0,
+        start: float = None,
+        end: float = None,
+        cancel_token: CancelToken = None,
+        output_height: int = None,
+        max_size: tuple = None,
+        interpolation: str = 'area'
+    ):
+        self._proc = None
+        info = probe_media(input_video_path)
+        if not info.has_video:
+            raise FileNotFoundError(f"No video stream in: {input_video_path}")
+
+        # FFmpeg applies rotation metadata while decoding, as OpenCV does,
+        # and the probed size already accounts for it
+        width, height = info.width, info.height
+        self.frame_size = output_size(width, height, output_height, max_size)
+        self._frame_bytes = self.frame_size[0] * self.frame_size[1] * 3
+
+        self.fps = info.fps
+        duration = info.duration
+        frame_count = info.frame_count
+        start = max(0.0, start or 0.0)
+        if start or end is not None:
+            stop = duration if end is None else min(end, duration or end)
+            frame_count = max(0, int(round((stop - start) * self.fps)))
+        self.frame_count = frame_count
+
+        cmd = ['ffmpeg', '-v', 'error', '-threads', str(int(threads))]
+        if start:
+            cmd += ['-ss', f'{start:.6f}']
+        cmd += ['-i', input_video_path, '-map', '0:v:0', '-an', '-sn']
+        if end is not None:
+            cmd += ['-t', f'{max(0.0, end - start):.6f}']
+        if self.frame_size != (width, height):
+            # Scaled in FFmpeg, so full-size frames never cross the pipe
+            cmd += ['-vf', 'scale={}:{}:flags={}'.format(*self.frame_size, INTERPOLATIONS[interpolation][1])]
+        # One output frame per decoded frame, no duplication or dropping
+        cmd += ['-vsync', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+
+        self.cancel_token = cancel_token
+        self._stderr = tempfile.TemporaryFile()
+        # Unbuffered: readinto() goes straight from the pipe into the frame
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=self._stderr, bufsize=0)
+        if cancel_token:
+            cancel_token.register(self._proc)
+
+    def isOpened(self) -> bool:
+        return self._proc is not None
+
+    def get(self, prop_id: int) -> float:
+        """The cv2.CAP_PROP_* values the watermark engine asks for."""
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frame_size[0])
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frame_size[1])
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        return 0.0
+
+    def read(self, frame: np.ndarray = None) -> tuple:
+        """Like cv2.VideoCapture.read(): (ok, frame), reusing ``frame`` if it fits."""
+        if self._proc is None:
+            return False, None
+        width, height = self.frame_size
+        if (frame is None or frame.shape != (height, width, 3) or frame.dtype != np.uint8
+                or not frame.flags.c_contiguous):
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < self._frame_bytes:
+            count = self._proc.stdout.readinto(view[filled:])
+            if not count:
+                # End of stream (a partial trailing frame is discarded). A
+                # decoder that died on an error raises here instead of
+                # passing for the end of the video
+                self._close(stopping=False)
+                return False, None
+            filled += count
+        return True, frame
+
+    def release(self):
+        self._close(stopping=True)
+
+    def _close(self, stopping: bool):
+        if self._proc is None:
+            return
+        proc, self._proc = self._proc, None
+        proc.stdout.close()
+        # Stopping early (end of the job, or an error) is not a failure
+        terminated = stopping and proc.poll() is None
+        if terminated:
+            proc.terminate()
+        returncode = proc.wait()
+        if self.cancel_token:
+            self.cancel_token.unregister(proc)
+
+        self._stderr.seek(0)
+        error = self._stderr.read().decode('utf-8', errors='replace').strip()
+        self._stderr.close()
+        if self.cancel_token:
+            self.cancel_token.raise_if_cancelled()
+        if returncode != 0 and not terminated:
+            tail = '\n'.join(error.splitlines()[-STDERR_TAIL_LINES:])
+            raise RuntimeError(f"FFmpeg decoding failed ({returncode}): {tail}")
+
+
+class ScaledCapture:
+    """
+    Wraps a capture so every frame is downscaled once, right after decoding.
+
+    read(frame) resizes into ``frame`` when it has the output size, so the
+    frame loops' buffer reuse carries over; the full-size decode buffer is
+    reused too.
+
+    Args:
+        cap: Opened cv2.VideoCapture or FFmpegReader
+        frame_size: (width, height) to scale to
+        interpolation: Scaling filter, one of INTERPOLATIONS
+    """
+
+    def __init__(self, cap, frame_size: tuple, interpolation: str = 'area'):
+        self.cap = cap
+        self.frame_size = frame_size
+        self._interpolation = INTERPOLATIONS[interpolation][0]
+        self._decoded = None
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.frame_size[0])
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.frame_size[1])
+        return self.cap.get(prop_id)
+
+    def set(self, prop_id: int, value: float) -> bool:
+        """Passed to the wrapped capture, e.g. CAP_PROP_POS_FRAMES to seek."""
+        return self.cap.set(prop_id, value)
+
+    def read(self, frame: np.ndarray = None) -> tuple:
+        ret, self._decoded = self.cap.read(self._decoded) if self._decoded is not None else self.cap.read()
+        if not ret:
+            return False, None
+        width, height = self.frame_size
+        if frame is not None and (frame.shape != (height, width, 3) or frame.dtype != np.uint8):
+            frame = None
+        return True, cv2.resize(self._decoded, self.frame_size, dst=frame, interpolation=self._interpolation)
+
+    def release(self):
+        self.cap.release()
+
+
+def open_video(
+    input_video_path: str,
+    reader: str = 'opencv',
+    threads: int = 0,
+    cancel_token: CancelToken = None,
+    output_height: int = None,
+    max_size: tuple = None,
+    interpolation: str = 'area'
+):
+    """
+    Open a video for frame-by-frame reading.
+
+    Args:
+        input_video_path: Path to input video
+        reader: 'opencv' (cv2.VideoCapture) or 'ffmpeg' (FFmpegReader)
+        threads: Decoder threads for the 'ffmpeg' reader (0 = auto)
+        cancel_token: Optional CancelToken for the 'ffmpeg' reader's process
+        output_height: Optional height to downscale frames to on read
+        max_size: Optional (width, height) to downscale frames to fit
+        interpolation: Scaling filter, one of INTERPOLATIONS
+
+    Returns:
+        An object with cv2.VideoCapture's isOpened/get/read/release;
+        get() reports the output frame size
+    """
+    if reader not in READERS:
+        raise ValueError(f"Unknown reader '{reader}'; choose from {READERS}")
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(f"Unknown interpolation '{interpolation}'; choose from {tuple(INTERPOLATIONS)}")
+    if reader == 'ffmpeg':
+        try:
+            return FFmpegReader(
+                input_video_path, threads=threads, cancel_token=cancel_token,
+                output_height=output_height, max_size=max_size, interpolation=interpolation
+            )
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Cannot open video: {input_video_path}")
+
+    cap = cv2.VideoCapture(input_video_path)
+    if cap.isOpened() and (output_height or max_size):
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        size = output_size(width, height, output_height, max_size)
+        if size != (width, height):
+            return ScaledCapture(cap, size, interpolation)
+    return cap
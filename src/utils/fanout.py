@@ -0,0 +1,315 @@
+import itertools
+import json
+import os
+import re
+import time
+
+import cv2
+
+from utils.cancellation import CANCEL_CHECK_FRAMES, CancelToken, ProcessingCancelled
+from utils.compression import (
+    FFmpegWriter, encode_report, predicted_size_mb, size_target
+)
+from utils.decoder import open_video, output_size
+from utils.jobs import atomic_output
+from utils.layers import LayerStack, build_layers, build_stack
+from utils.media_info import probe_media
+from utils.memory import peak_rss_mb, plan_memory
+from utils.progress import ProgressReporter
+
+# Style of the per-recipient ID unless the caller passes its own; random
+# jumps make the ID hard to crop or blur out of the whole video
+RECIPIENT_TEXT_LAYER = {
+    'type': 'text',
+    'scale': 0.035,
+    'opacity': 0.35,
+    'motion': 'random',
+    'motion_options': {'hold_seconds': 4.0},
+}
+
+
+def read_recipients(path: str, output_dir: str, base_name: str, text_template: str = '{id}') -> list:
+    """
+    Load recipients from a .txt file (one ID per line, ``#`` comments) or a
+    .json list of IDs or dicts with ``id`` and optional ``text``,
+    ``layers`` and ``output_video_path``.
+
+    Missing outputs default to ``<output_dir>/<base_name>_<id>.mp4`` and
+    missing texts to ``text_template`` formatted with the ID.
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [line.split('#', 1)[0].strip() for line in f]
+
+    recipients = []
+    for entry in entries:
+        if not entry:
+            continue
+        recipient = dict(entry) if isinstance(entry, dict) else {'id': entry}
+        recipient_id = str(recipient.get('id', len(recipients)))
+        safe_id = re.sub(r'[^A-Za-z0-9._-]+', '_', recipient_id)
+        recipient.setdefault('text', text_template.format(id=recipient_id))
+        recipient.setdefault('output_video_path', os.path.join(output_dir, f'{base_name}_{safe_id}.mp4'))
+        recipients.append(recipient)
+    return recipients
+
+
+def recipient_layer_specs(recipient: dict, text_layer: dict = None) -> list:
+    """Layer specs for one recipient: their own ``layers`` plus their ``text`` ID."""
+    specs = list(recipient.get('layers') or [])
+    if recipient.get('text'):
+        specs.append(dict(text_layer or RECIPIENT_TEXT_LAYER, text=str(recipient['text'])))
+    return specs
+
+
+def add_watermarks_fanout(
+    input_video_path: str,
+    logo_path: str,
+    recipients: list,
+    speed: int = 5,
+    scale: float = 0.08,
+    opacity: float = 0.25,
+    quality: int = 23,
+    motion: str = 'bounce',
+    motion_options: dict = None,
+    target_size_mb: float = 10.0,
+    rate_control: str = 'crf',
+    preset: str = 'slow',
+    layers: list = None,
+    text_layer: dict = None,
+    max_encoders: int = 4,
+    progress=None,
+    cancel_token: CancelToken = None,
+    reader: str = 'opencv',
+    decode_threads: int = 0,
+    output_height: int = None,
+    max_size: tuple = None,
+    interpolation: str = 'area',
+    memory_budget_mb: float = None
+) -> list:
+    """
+    Watermark one video for many recipients, decoding it once per group
+    of ``max_encoders`` recipients instead of once per recipient.
+
+    Each decoded frame gets the shared logo and ``layers`` blended in once.
+    Then, recipient by recipient, their own layers are blended into their
+    ROIs, the frame is piped to that recipient's FFmpeg encoder and the
+    ROIs are restored, so no full-frame copies are made and memory stays
+    at one frame plus the encoders' own buffers.
+
+    Each recipient's output is written to a partial file and renamed into
+    place once its encoder has finished (see atomic_output). A recipient
+    whose encoder fails is stopped and reported as 'failed' while the rest
+    carry on; any other error stops every encoder of the group, removes
+    their partial files and is raised.
+
+    Args:
+        input_video_path: Path to input video
+        logo_path: Shared watermark image (may be None with ``layers``)
+        recipients: Dicts with ``output_video_path`` and a ``text`` ID
+            and/or extra ``layers`` specs (see build_layers); other keys,
+            e.g. ``id``, are passed through to the results
+        speed: Speed of the shared logo (pixels per frame)
+        scale: Size of the shared logo relative to video height
+        opacity: Opacity of the shared logo (0.0 to 1.0)
+        quality: CRF value used by 'crf'
+        motion: Motion pattern of the shared logo
+        motion_options: Extra make_trajectory() arguments, e.g. hold_seconds
+        target_size_mb: Target file size in MB for 'abr'
+        rate_control: 'crf' or 'abr'; 'two-pass' would need a second decode
+        preset: x264 preset
+        layers: Extra layers drawn for every recipient
+        text_layer: Layer spec used to draw each recipient's ``text``
+            (defaults to RECIPIENT_TEXT_LAYER)
+        max_encoders: FFmpeg encoders running at the same time; more
+            recipients than this are processed in groups
+        progress: Optional callback receiving ProgressReporter snapshots
+        cancel_token: Optional CancelToken; cancelling removes the current
+            group's partial outputs and raises ProcessingCancelled
+        reader: Frame source, 'opencv' or 'ffmpeg' (see open_video)
+        decode_threads: Decoder threads for the 'ffmpeg' reader (0 = auto)
+        output_height: Downscale frames to this height once, before any
+            blending (see open_video)
+        max_size: Alternatively or also, (width, height) to fit within
+        interpolation: Scaling filter, one of INTERPOLATIONS
+        memory_budget_mb: Peak memory to stay within; every encoder holds
+            its own lookahead, so the lookahead is cut first and then
+            ``max_encoders`` lowered (see plan_memory)
+
+    Returns:
+        One result dict per recipient, in order, with output, status ('ok'
+        or 'failed'), error and the encode size report
+    """
+    if rate_control == 'two-pass':
+        raise ValueError("Fan-out encodes in a single pass; use 'crf' or 'abr'")
+    if not logo_path and not layers:
+        raise ValueError("A logo or at least one layer is required")
+    max_encoders = max(1, int(max_encoders))
+    lookahead = None
+    if memory_budget_mb:
+        try:
+            info = probe_media(input_video_path)
+        except FileNotFoundError:
+            info = None
+        if info is None or not info.has_video:
+            raise FileNotFoundError(f"Cannot open video: {input_video_path}")
+        memory = plan_memory(
+            output_size(info.width, info.height, output_height, max_size), memory_budget_mb, 1, preset,
+            encoders=max(1, min(max_encoders, len(recipients))), source_size=(info.width, info.height)
+        )
+        max_encoders, lookahead = memory['encoders'], memory['lookahead']
+    groups = [recipients[i:i + max_encoders] for i in range(0, len(recipients), max_encoders)]
+
+    geometry = {'output_height': output_height, 'max_size': max_size, 'interpolation': interpolation}
+    results = []
+    for number, group in enumerate(groups, 1):
+        stage = f'fan-out {number}/{len(groups)}' if len(groups) > 1 else 'fan-out'
+        results += _fan_out_group(
+            input_video_path, logo_path, group, int(speed), scale, opacity, quality,
+            motion, motion_options or {}, target_size_mb, rate_control, preset,
+            layers or [], text_layer, stage, progress, cancel_token, reader, decode_threads, geometry,
+            lookahead
+        )
+    return results
+
+
+def _fan_out_group(
+    input_video_path, logo_path, group, speed, scale, opacity, quality,
+    motion, motion_options, target_size_mb, rate_control, preset,
+    layers, text_layer, stage, progress, cancel_token, reader, decode_threads, geometry,
+    lookahead
+) -> list:
+    cap = open_video(input_video_path, reader, decode_threads, cancel_token, **geometry)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open video: {input_video_path}")
+    results = []
+    active = []
+    try:
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        shared = LayerStack(build_stack(
+            logo_path, layers, width, height, fps, scale, opacity, motion, speed, motion_options
+        ))
+        duration = frame_count / fps if fps else 0
+        bitrate_kbps, audio_kbps = size_target(
+            input_video_path, group[0]['output_video_path'], rate_control, target_size_mb, duration
+        )
+
+        reporter = ProgressReporter(progress, stage, frame_count)
+        clock = time.perf_counter
+        shared_positions = shared.positions()
+        frame = None
+
+        for recipient in group:
+            result = {key: value for key, value in recipient.items() if key not in ('layers', 'output_video_path')}
+            result.update(output=recipient['output_video_path'], status='ok', error=None, encode=None)
+            results.append(result)
+
+            specs = recipient_layer_specs(recipient, text_layer)
+            own = LayerStack(build_layers(specs, width, height, fps)) if specs else None
+            # Entered here and exited per recipient (see _finish/_abandon),
+            # since recipients fail independently of each other
+            output = atomic_output(recipient['output_video_path'])
+            path = output.__enter__()
+            try:
+                writer = FFmpegWriter(
+                    path, (width, height), fps,
+                    audio_source_path=input_video_path, quality=quality, preset=preset,
+                    rate_control=rate_control, bitrate_kbps=bitrate_kbps, cancel_token=cancel_token,
+                    lookahead=lookahead
+                )
+            except BaseException as e:
+                output.__exit__(type(e), e, e.__traceback__)
+                raise
+            positions = own.positions() if own else itertools.repeat(((),))
+            active.append((result, own, writer, positions, output))
+
+        for index in itertools.count():
+            if cancel_token and index % CANCEL_CHECK_FRAMES == 0:
+                cancel_token.raise_if_cancelled()
+            if not active:
+                break
+
+            started = clock()
+            ret, frame = cap.read(frame) if frame is not None else cap.read()
+            if not ret:
+                break
+            decoded = clock()
+            shared.blend_at(frame, *next(shared_positions))
+            reporter.add_time('blend', clock() - decoded)
+            reporter.add_time('decode', decoded - started)
+
+            for entry in list(active):
+                result, own, writer, positions, output = entry
+                placements, = next(positions)
+
+                started = clock()
+                saved = []
+                if placements:
+                    saved = [(window, frame[window].copy()) for window in own.windows(frame.shape, placements)]
+                    own.blend_at(frame, placements)
+                blended = clock()
+
+                try:
+                    writer.write(frame)
+                except ProcessingCancelled:
+                    raise
+                except Exception as e:
+                    active.remove(entry)
+                    _abandon(entry, e)
+
+                # Undo this recipient's layers for the next one
+                for window, original in reversed(saved):
+                    frame[window] = original
+                reporter.add_time('blend', blended - started)
+                reporter.add_time('encode', clock() - blended)
+            reporter.advance()
+
+        while active:
+            entry = active.pop(0)
+            try:
+                _finish(entry)
+            except ProcessingCancelled as e:
+                _abandon(entry, e)
+                raise
+            except Exception as e:
+                _abandon(entry, e)
+    except BaseException as e:
+        # Cancelled, or a decode/blend/encoder error: stop every encoder
+        # still running and leave no partial output behind
+        for entry in active:
+            _abandon(entry, e)
+        raise
+    finally:
+        cap.release()
+    reporter.finish()
+
+    predicted_mb = predicted_size_mb(rate_control, bitrate_kbps, duration, audio_kbps)
+    for result in results:
+        if result['status'] == 'ok':
+            result['encode'] = encode_report(result['output'], rate_control, preset, predicted_mb)
+            result['encode']['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def _finish(entry):
+    """Close a recipient's encoder and rename its partial file into place."""
+    result, own, writer, positions, output = entry
+    writer.release()
+    output.__exit__(None, None, None)
+
+
+def _abandon(entry, error: BaseException):
+    """Stop a failed recipient's encoder, remove its partial file and record the error."""
+    result, own, writer, positions, output = entry
+    try:
+        writer.release()
+    except Exception:
+        pass
+    output.__exit__(type(error), error, error.__traceback__)
+    result.update(status='failed', error=f'{type(error).__name__}: {error}')
@@ -0,0 +1,193 @@
+import os
+import tempfile
+
+import cv2
+
+from utils.cancellation import CancelToken, ProcessingCancelled, remove_partial_output
+from utils.compression import (
+    audio_stream_args, encode_report, predicted_size_mb, remove_pass_logs, size_target, video_encoder_args
+)
+from utils.decoder import INTERPOLATIONS, output_size
+from utils.logo_cache import read_logo
+from utils.media_info import probe_media
+from utils.memory import peak_rss_mb, plan_memory
+from utils.progress import ProgressReporter, run_ffmpeg
+from utils.trajectory import make_trajectory
+
+
+# Frame index inside the overlay filter. The main input is retimed to
+# N / FRAME_RATE first (constant frame rate, like the OpenCV writer), so
+# the index follows from t; overlay's own ``n`` is not reliably 0-based.
+FRAME_INDEX = 'floor(t*{fps}+0.5)'
+
+
+def build_filtergraph(x_expr: str, y_expr: str, opacity: float, size: tuple = None, flags: str = 'area') -> str:
+    """
+    Filtergraph that fades the logo (input 1) to ``opacity`` and overlays it
+    on the video (input 0) at per-frame x/y expressions, after scaling the
+    video to ``size`` with the ``flags`` scaler if given.
+
+    Blending happens in planar RGB, which matches the OpenCV path and, unlike
+    yuv420, does not round the logo position to even pixels.
+    """
+    scale = f"scale={size[0]}:{size[1]}:flags={flags}," if size else ''
+    return (
+        f"[0:v]{scale}setpts=N/FRAME_RATE/TB[main];"
+        f"[1:v]format=rgba,colorchannelmixer=aa={float(opacity):.4f}[logo];"
+        f"[main][logo]overlay=x='{x_expr}':y='{y_expr}':eval=frame:format=gbrp,"
+        f"format=yuv420p[v]"
+    )
+
+
+def add_moving_watermark_ffmpeg(
+    input_video_path: str,
+    logo_path: str,
+    output_video_path: str,
+    speed: int = 5,
+    scale: float = 0.08,
+    opacity: float = 0.25,
+    compress: bool = True,
+    quality: int = 23,
+    motion: str = 'bounce',
+    motion_options: dict = None,
+    target_size_mb: float = 10.0,
+    rate_control: str = 'crf',
+    preset: str = 'slow',
+    progress=None,
+    cancel_token: CancelToken = None,
+    output_height: int = None,
+    max_size: tuple = None,
+    interpolation: str = 'area',
+    memory_budget_mb: float = None
+):
+    """
+    Add a moving watermark entirely inside FFmpeg's overlay filter, so no
+    frames pass through Python.
+
+    The logo is sized with the same OpenCV resize as the OpenCV path and
+    positions come from the trajectory's FFmpeg expressions, so the logo
+    lands on exactly the same pixels. Only 'bounce', 'diagonal' and
+    'corners' motion have an expression form.
+
+    Args:
+        input_video_path: Path to input video
+        logo_path: Path to watermark image (PNG with transparency recommended)
+        output_video_path: Path to save watermarked video
+        speed: Speed of watermark movement (pixels per frame)
+        scale: Size of watermark relative to video height
+        opacity: Opacity of watermark (0.0 to 1.0)
+        compress: Encode with libx264 using the compress_video settings;
+            otherwise write MPEG-4 Part 2 like the uncompressed OpenCV path
+        quality: CRF value (0-51, lower is better quality)
+        motion: Motion pattern ('bounce', 'diagonal', 'corners')
+        motion_options: Extra make_trajectory() arguments, e.g. hold_seconds
+        target_size_mb: Target file size in MB for 'abr' and 'two-pass'
+        rate_control: 'crf', 'abr' or 'two-pass' (see video_encoder_args)
+        preset: x264 preset
+        progress: Optional callback receiving ProgressReporter snapshots
+            parsed from FFmpeg's -progress output
+        cancel_token: Optional CancelToken; cancelling terminates FFmpeg,
+            removes the partial output and raises ProcessingCancelled
+        output_height: Downscale the video to this height before the overlay
+        max_size: Alternatively or also, (width, height) to fit within
+        interpolation: Scaling filter, one of INTERPOLATIONS
+        memory_budget_mb: Peak memory to stay within; FFmpeg holds no
+            frame ring, so only x264's lookahead is cut to fit
+
+    Returns:
+        Predicted versus actual size report when compress is enabled, with
+        the memory plan and peak_rss_mb
+    """
+    try:
+        info = probe_media(input_video_path)
+    except FileNotFoundError:
+        info = None
+    if info is None or not info.has_video:
+        raise FileNotFoundError(f"Cannot open video: {input_video_path}")
+    width, height = info.width, info.height
+    fps = info.fps
+    frame_count = info.frame_count
+
+    if interpolation not in INTERPOLATIONS:
+        raise ValueError(f"Unknown interpolation '{interpolation}'; choose from {tuple(INTERPOLATIONS)}")
+    size = output_size(width, height, output_height, max_size)
+    scaled = size if size != (width, height) else None
+    width, height = size
+
+    memory = None
+    lookahead = None
+    if memory_budget_mb:
+        memory = plan_memory(
+            size, memory_budget_mb, 1, preset, compress=compress, source_size=(info.width, info.height)
+        )
+        lookahead = memory['lookahead']
+
+    logo = read_logo(logo_path, int(height * float(scale)))
+    logo_h, logo_w = logo.shape[:2]
+    trajectory = make_trajectory(
+        motion, width, height, logo_w, logo_h,
+        speed=int(speed), fps=fps, **(motion_options or {})
+    )
+    if not trajectory.supports_ffmpeg:
+        raise ValueError(f"Motion '{motion}' is not supported by the FFmpeg backend")
+    x_expr, y_expr = trajectory.ffmpeg_expressions(FRAME_INDEX.format(fps=fps))
+
+    duration = frame_count / fps if fps else 0
+    audio_args, audio_kbps = audio_stream_args(input_video_path, output_video_path)
+    bitrate_kbps = None
+    if compress:
+        bitrate_kbps, _ = size_target(
+            input_video_path, output_video_path, rate_control, target_size_mb, duration, audio_kbps
+        )
+
+    passlog = os.path.splitext(output_video_path)[0] + '.passlog'
+    with tempfile.TemporaryDirectory(prefix='watermark-logo-') as tmp:
+        # The pre-sized logo keeps FFmpeg's scaler out of the picture
+        sized_logo_path = os.path.join(tmp, 'logo.png')
+        cv2.imwrite(sized_logo_path, logo)
+
+        base = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', input_video_path, '-i', sized_logo_path,
+            '-filter_complex', build_filtergraph(
+                x_expr, y_expr, opacity, scaled, INTERPOLATIONS[interpolation][1]
+            ),
+            '-map', '[v]',
+        ]
+        audio = ['-map', '0:a:0?'] + audio_args
+
+        if not compress:
+            passes = [base + ['-c:v', 'mpeg4', '-q:v', '2'] + audio + [output_video_path]]
+        elif rate_control == 'two-pass':
+            passes = [
+                base + video_encoder_args(rate_control, quality, bitrate_kbps, preset, 1, passlog, lookahead)
+                + ['-an', '-f', 'null', os.devnull],
+                base + video_encoder_args(rate_control, quality, bitrate_kbps, preset, 2, passlog, lookahead)
+                + audio + [output_video_path],
+            ]
+        else:
+            passes = [
+                base + video_encoder_args(rate_control, quality, bitrate_kbps, preset, lookahead=lookahead)
+                + audio + [output_video_path]
+            ]
+
+        try:
+            for i, cmd in enumerate(passes, 1):
+                stage = f'watermark pass {i}/{len(passes)}' if len(passes) > 1 else 'watermark'
+                reporter = ProgressReporter(progress, stage, frame_count) if progress else None
+                run_ffmpeg(cmd, reporter, duration, cancel_token)
+                if reporter:
+                    reporter.finish()
+        except ProcessingCancelled:
+            remove_partial_output(output_video_path)
+            raise
+        finally:
+            remove_pass_logs(passlog)
+
+    if not compress:
+        return None
+    predicted_mb = predicted_size_mb(rate_control, bitrate_kbps, duration, audio_kbps)
+    report = encode_report(output_video_path, rate_control, preset, predicted_mb)
+    report['memory'] = memory
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
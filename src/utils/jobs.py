@@ -0,0 +1,254 @@
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+
+from utils.cancellation import remove_partial_output
+
+# Task params that change how a job runs but not the video it produces,
+# so they are left out of the job key
+RUNTIME_PARAMS = (
+    'workers', 'reader', 'decode_threads', 'progress', 'cancel_token', 'memory_budget_mb', 'work_dir'
+)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    output TEXT PRIMARY KEY,
+    input TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+'''
+
+
+def partial_path(output_path: str) -> str:
+    """
+    Unique hidden path next to ``output_path`` with the same extension, so
+    FFmpeg picks the same container and concurrent jobs never collide.
+    """
+    directory, name = os.path.split(output_path)
+    root, ext = os.path.splitext(name)
+    return os.path.join(directory, f'.{root}.{uuid.uuid4().hex[:12]}.partial{ext}')
+
+
+def stale_partials(output_path: str) -> list:
+    """partial_path() files a killed run left behind for ``output_path``."""
+    directory, name = os.path.split(output_path)
+    root, ext = os.path.splitext(name)
+    return glob.glob(os.path.join(glob.escape(directory), f'.{glob.escape(root)}.*.partial*{glob.escape(ext)}'))
+
+
+def segments_work_dir(output_path: str) -> str:
+    """
+    Hidden directory next to ``output_path`` where a segmented job keeps
+    its finished segments, the same on every run so a rerun resumes.
+    """
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f'.{os.path.splitext(name)[0]}.segments')
+
+
+@contextlib.contextmanager
+def atomic_output(output_path: str):
+    """
+    Yield a partial_path() to write to; it is renamed onto ``output_path``
+    only if the block succeeds, so the output is either complete or absent.
+    """
+    path = partial_path(output_path)
+    try:
+        yield path
+        os.replace(path, output_path)
+    finally:
+        remove_partial_output(path)
+
+
+def layer_files(layers: list) -> list:
+    """
+    Files the layer specs (see build_layers) are drawn from: image
+    ``path``s and ``font`` files. A font given by name, resolved by Pillow,
+    is not a file here and is left to the spec itself.
+    """
+    files = []
+    for spec in layers or []:
+        if spec.get('type', 'image') == 'image':
+            if spec.get('path'):
+                files.append(spec['path'])
+        elif spec.get('font') and os.path.isfile(spec['font']):
+            files.append(spec['font'])
+    return files
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class JobQueue:
+    """
+    Batch jobs persisted in SQLite, so a rerun after a crash only pays for
+    unfinished work.
+
+    Every job has a content-addressed key: the SHA-256 of the input file,
+    of the logo, of the layers' image and font files and of the
+    output-affecting params. plan() skips jobs whose output was already
+    finished with the same key, and links or copies a finished output of
+    the same key written to another path instead of rendering it again.
+    Jobs a crashed run left 'running' are queued again and their partial
+    files removed. File hashes are cached by path, mtime and size.
+
+    Only the process that owns the queue touches the database; worker
+    processes just render.
+
+    Args:
+        db_path: SQLite file, created if missing
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.executescript(SCHEMA)
+            self._db.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+
+    def close(self):
+        self._db.close()
+
+    def digest(self, path: str) -> str:
+        """SHA-256 of a file, recomputed only when its mtime or size changes."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self._db.execute(
+            'SELECT sha256 FROM digests WHERE path = ? AND mtime_ns = ? AND size = ?',
+            (path, stat.st_mtime_ns, stat.st_size)
+        ).fetchone()
+        if row:
+            return row['sha256']
+        sha = file_digest(path)
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)',
+                (path, stat.st_mtime_ns, stat.st_size, sha)
+            )
+        return sha
+
+    def job_key(self, task: dict) -> str:
+        """Key of the video a task produces (see process_one for the task format)."""
+        params = {k: v for k, v in task['params'].items() if k not in RUNTIME_PARAMS}
+        logo_path = task.get('logo_path')
+        spec = {
+            'input': self.digest(task['input_video_path']),
+            'logo': self.digest(logo_path) if logo_path else None,
+            'layers': [self.digest(path) for path in layer_files(params.get('layers'))],
+            'params': params,
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def plan(self, tasks: list) -> tuple:
+        """
+        Split tasks into those still to run and results for those that won't.
+
+        Tasks to run are recorded as 'queued' and get a ``job_key``. A task
+        whose input or logo cannot be read gets a 'failed' result instead,
+        so the rest of the batch still runs.
+
+        Returns:
+            (tasks to run, results of skipped and failed tasks)
+        """
+        todo, skipped = [], []
+        for task in tasks:
+            try:
+                key = task['job_key'] = self.job_key(task)
+            except OSError as e:
+                skipped.append({
+                    'input': task['input_video_path'],
+                    'output': task['output_video_path'],
+                    'status': 'failed',
+                    'error': f'{type(e).__name__}: {e}',
+                    'encode': None,
+                    'seconds': 0.0,
+                })
+                continue
+            output = os.path.abspath(task['output_video_path'])
+            source = self._finished_output(key, output)
+            if source is None:
+                with self._db:
+                    self._db.execute(
+                        'INSERT INTO jobs (output, input, key, status, updated) VALUES (?, ?, ?, ?, ?) '
+                        'ON CONFLICT (output) DO UPDATE SET input = excluded.input, key = excluded.key, '
+                        'status = excluded.status, error = NULL, updated = excluded.updated',
+                        (output, task['input_video_path'], key, 'queued', time.time())
+                    )
+                for path in stale_partials(output):
+                    remove_partial_output(path)
+                todo.append(task)
+                continue
+
+            result = {
+                'input': task['input_video_path'],
+                'output': task['output_video_path'],
+                'status': 'skipped',
+                'error': None,
+                'encode': None,
+                'seconds': 0.0,
+                'reused': None,
+            }
+            if source != output:
+                # Same video already rendered elsewhere: reuse it
+                with atomic_output(output) as path:
+                    try:
+                        os.link(source, path)
+                    except OSError:
+                        shutil.copyfile(source, path)
+                result['reused'] = source
+                self.finish(task, result, status='done')
+            skipped.append(result)
+        return todo, skipped
+
+    def _finished_output(self, key: str, output: str):
+        rows = self._db.execute(
+            "SELECT output FROM jobs WHERE key = ? AND status = 'done' ORDER BY output = ? DESC",
+            (key, output)
+        ).fetchall()
+        for row in rows:
+            if os.path.isfile(row['output']):
+                return row['output']
+        return None
+
+    def start(self, task: dict):
+        with self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? WHERE output = ?",
+                (time.time(), os.path.abspath(task['output_video_path']))
+            )
+
+    def finish(self, task: dict, result: dict, status: str = None):
+        """Record a process_one() result ('ok' becomes 'done')."""
+        status = status or ('done' if result['status'] == 'ok' else 'failed')
+        with self._db:
+            self._db.execute(
+                'INSERT INTO jobs (output, input, key, status, error, result, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (output) DO UPDATE SET '
+                'key = excluded.key, status = excluded.status, error = excluded.error, '
+                'result = excluded.result, updated = excluded.updated',
+                (os.path.abspath(task['output_video_path']), task['input_video_path'], task['job_key'],
+                 status, result.get('error'), json.dumps(result, default=str), time.time())
+            )
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from utils.options import CACHE_DIR_ENV
+from utils.overlay import WatermarkOverlay
+
+
+def read_logo(logo_path: str, logo_h: int) -> np.ndarray:
+    """
+    Decode a logo as BGRA and resize it to ``logo_h`` pixels high,
+    keeping its aspect ratio.
+    """
+    # Load logo image with alpha channel
+    logo = cv2.imread(logo_path, cv2.IMREAD_UNCHANGED)
+    if logo is None:
+        raise ValueError("Cannot load logo image")
+
+    # Convert to RGBA if not already
+    if logo.ndim == 2:
+        logo = cv2.cvtColor(logo, cv2.COLOR_GRAY2BGRA)
+    elif logo.shape[2] == 3:
+        logo = cv2.cvtColor(logo, cv2.COLOR_BGR2BGRA)
+
+    # Resize logo
+    logo_w = int(logo.shape[1] * (logo_h / logo.shape[0]))
+    return cv2.resize(logo, (logo_w, logo_h), interpolation=cv2.INTER_AREA)
+
+
+class LogoCache:
+    """
+    Prepared watermark overlays keyed by logo content hash, target height
+    and opacity.
+
+    An in-memory LRU serves repeat requests within a process; with a
+    ``cache_dir`` the premultiplied arrays are also stored as ``.npy`` files
+    so other processes and later jobs skip the decode and resize too.
+
+    Args:
+        max_entries: Overlays kept in memory
+        cache_dir: Optional directory for the on-disk store
+    """
+
+    def __init__(self, max_entries: int = 32, cache_dir: str = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def digest(self, logo_path: str) -> str:
+        """SHA-256 of the logo file, recomputed only when its mtime or size changes."""
+        stat = os.stat(logo_path)
+        stamp = (os.path.abspath(logo_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._digests.get(stamp)
+        if cached:
+            return cached
+
+        sha = hashlib.sha256()
+        with open(logo_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha.update(chunk)
+        with self._lock:
+            self._digests[stamp] = sha.hexdigest()
+        return sha.hexdigest()
+
+    def get(self, logo_path: str, logo_h: int, opacity: float) -> WatermarkOverlay:
+        """Return an overlay for the logo at ``logo_h`` pixels high and ``opacity``."""
+        if not os.path.isfile(logo_path):
+            raise ValueError("Cannot load logo image")
+
+        opacity = round(float(opacity), 4)
+        key = (self.digest(logo_path), int(logo_h), opacity)
+
+        with self._lock:
+            arrays = self._entries.get(key)
+            if arrays is not None:
+                self._entries.move_to_end(key)
+
+        if arrays is None:
+            arrays = self._load(key)
+            if arrays is None:
+                overlay = WatermarkOverlay(read_logo(logo_path, int(logo_h)), opacity)
+                arrays = (overlay.premultiplied, overlay.inverse_alpha)
+                self._store(key, arrays)
+            for array in arrays:
+                array.flags.writeable = False  # Shared between overlays
+
+            with self._lock:
+                self._entries[key] = arrays
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return WatermarkOverlay.from_arrays(arrays[0], arrays[1], opacity)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+
+    def _path(self, key) -> str:
+        digest, logo_h, opacity = key
+        return os.path.join(self.cache_dir, f'{digest}_{logo_h}_{opacity:.4f}.npy')
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            # Stored as one (h, w, 4) array: premultiplied BGR + inverse alpha
+            stacked = np.load(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return np.ascontiguousarray(stacked[:, :, :3]), np.ascontiguousarray(stacked[:, :, 3:])
+
+    def _store(self, key, arrays):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # Write then rename, so concurrent readers never see a partial file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.concatenate(arrays, axis=2))
+        os.replace(tmp_path, path)
+
+
+_default_cache = None
+
+
+def get_logo_cache() -> LogoCache:
+    """
+    Process-wide logo cache. The on-disk store is enabled by setting the
+    VIDEO_WATERMARKER_LOGO_CACHE environment variable to a directory,
+    which worker processes inherit.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LogoCache(cache_dir=os.environ.get(CACHE_DIR_ENV) or None)
+    return _default_cache
@@ -0,0 +1,183 @@
+import json
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+# Everything any stage needs, fetched in one ffprobe run per file
+PROBE_ENTRIES = (
+    'stream=index,codec_type,codec_name,width,height,r_frame_rate,avg_frame_rate,'
+    'nb_frames,duration,bit_rate:stream_tags=rotate:stream_side_data=rotation:'
+    'format=duration,bit_rate,format_name'
+)
+
+
+def _as_float(value, default=0.0) -> float:
+    try:
+        return float(Fraction(str(value)))
+    except (ValueError, ZeroDivisionError):
+        return default
+
+
+def _kbps(bit_rate) -> int:
+    bit_rate = str(bit_rate or '')
+    return int(bit_rate) // 1000 if bit_rate.isdigit() else None
+
+
+class MediaInfo:
+    """
+    What one ffprobe run says about a media file.
+
+    Attributes:
+        path: Absolute path of the file
+        stamp: (path, mtime_ns, size) the info was probed for
+        width, height: Display size of the first video stream (rotation
+            applied, as decoders deliver frames); None without video
+        fps: Frame rate (r_frame_rate, falling back to avg_frame_rate)
+        frame_count: Stored frame count, or duration * fps if not stored
+        duration: Seconds (video stream, falling back to the container)
+        container_duration: Seconds of the whole file, all streams included
+        video_codec: e.g. 'h264'
+        rotation: Rotation metadata in degrees (0 if none)
+        audio: {'codec', 'bitrate_kbps'} of the first audio stream, or None
+        container: FFmpeg format name, e.g. 'mov,mp4,m4a,3gp,3g2,mj2'
+        bitrate_kbps: Overall bitrate of the file
+    """
+
+    def __init__(self, path: str, stamp: tuple, probe: dict):
+        self.path = path
+        self.stamp = stamp
+        streams = probe.get('streams') or []
+        fmt = probe.get('format') or {}
+        video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+        self.container = fmt.get('format_name')
+        self.bitrate_kbps = _kbps(fmt.get('bit_rate'))
+        self.audio = None
+        if audio is not None:
+            self.audio = {'codec': audio.get('codec_name'), 'bitrate_kbps': _kbps(audio.get('bit_rate'))}
+
+        self.width = self.height = self.video_codec = None
+        self.fps = 0.0
+        self.frame_count = 0
+        self.rotation = 0
+        self.container_duration = _as_float(fmt.get('duration'))
+        self.duration = self.container_duration
+        if video is None:
+            return
+
+        rotation = video.get('tags', {}).get('rotate')
+        for side_data in video.get('side_data_list', []):
+            rotation = side_data.get('rotation', rotation)
+        self.rotation = int(float(rotation or 0))
+        self.width, self.height = int(video['width']), int(video['height'])
+        if self.rotation % 180 != 0:
+            self.width, self.height = self.height, self.width
+
+        self.video_codec = video.get('codec_name')
+        self.fps = _as_float(video.get('r_frame_rate')) or _as_float(video.get('avg_frame_rate'))
+        self.duration = _as_float(video.get('duration')) or self.duration
+        self.frame_count = int(video.get('nb_frames') or 0) or int(round(self.duration * self.fps))
+
+    @property
+    def has_video(self) -> bool:
+        return self.width is not None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio is not None
+
+    def to_dict(self) -> dict:
+        return {key: value for key, value in vars(self).items() if key != 'stamp'}
+
+
+def _stamp(path: str) -> tuple:
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+class MediaInfoCache:
+    """
+    MediaInfo per file, keyed by path, mtime and size so an edited file is
+    probed again. Safe to share between threads.
+
+    Args:
+        max_entries: Files kept in memory
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> MediaInfo:
+        """Probe ``path`` unless it is cached; FileNotFoundError if it cannot be probed."""
+        try:
+            stamp = _stamp(path)
+        except OSError:
+            raise FileNotFoundError(f"Cannot probe media: {path}")
+        with self._lock:
+            info = self._entries.get(stamp)
+            if info is not None:
+                self._entries.move_to_end(stamp)
+                return info
+
+        cmd = ['ffprobe', '-v', 'error', '-show_entries', PROBE_ENTRIES, '-of', 'json', stamp[0]]
+        try:
+            probe = json.loads(subprocess.check_output(cmd, stderr=subprocess.DEVNULL))
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            raise FileNotFoundError(f"Cannot probe media: {path}")
+        info = MediaInfo(stamp[0], stamp, probe)
+        self.put(info)
+        return info
+
+    def put(self, info: MediaInfo):
+        """Add info probed elsewhere, e.g. by the parent of a worker process."""
+        with self._lock:
+            self._entries[info.stamp] = info
+            self._entries.move_to_end(info.stamp)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def probe_many(self, paths: list, max_workers: int = 8) -> dict:
+        """
+        Probe many files at once in a thread pool (ffprobe runs in its own
+        process, so the threads overlap fully).
+
+        Returns:
+            {path: MediaInfo, or the FileNotFoundError raised for it}
+        """
+        def probe(path):
+            try:
+                return self.get(path)
+            except FileNotFoundError as e:
+                return e
+
+        paths = list(paths)
+        if len(paths) <= 1:
+            return {path: probe(path) for path in paths}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+            return dict(zip(paths, pool.map(probe, paths)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_default_cache = None
+
+
+def get_media_info_cache() -> MediaInfoCache:
+    """Process-wide media info cache."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = MediaInfoCache()
+    return _default_cache
+
+
+def probe_media(path: str) -> MediaInfo:
+    """MediaInfo for ``path`` from the process-wide cache (see MediaInfoCache.get)."""
+    return get_media_info_cache().get(path)
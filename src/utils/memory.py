@@ -0,0 +1,141 @@
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Resident memory per frame pixel, measured with OpenCV's decoder and an
+# FFmpegWriter at 1080p and 2160p: the decoder's reference frames plus the
+# BGR conversion; FFmpeg's raw input queue and x264's reference frames,
+# threads and buffers (fixed); and each frame of x264 lookahead on top
+DECODER_BYTES_PER_PIXEL = 12
+X264_BYTES_PER_PIXEL = 74
+X264_LOOKAHEAD_BYTES_PER_PIXEL = 3.2
+BASE_MB = 60  # Interpreter, NumPy and OpenCV before any frame is touched
+ENCODER_BASE_MB = 60  # An FFmpeg process before any frame is touched
+
+# x264's rc-lookahead for each preset, and the least the budget cuts it to
+# (below this mbtree has too little to work with and quality drops fast)
+X264_LOOKAHEAD = {
+    'ultrafast': 0, 'superfast': 0, 'veryfast': 10, 'faster': 20, 'fast': 30,
+    'medium': 40, 'slow': 50, 'slower': 60, 'veryslow': 60,
+}
+MIN_LOOKAHEAD = 10
+
+
+def frame_mb(frame_size: tuple) -> float:
+    """Size of one (width, height) BGR frame in MB."""
+    width, height = frame_size
+    return width * height * 3 / 2**20
+
+
+def estimate_mb(
+    frame_size: tuple,
+    max_in_flight: int,
+    lookahead: int,
+    encoders: int = 1,
+    source_size: tuple = None
+) -> float:
+    """
+    Expected peak resident memory of one job in MB, FFmpeg encoders included.
+
+    Args:
+        frame_size: (width, height) of the frames blended and encoded
+        max_in_flight: Frames in the pipeline's buffer ring (1 when serial)
+        lookahead: x264 rc-lookahead frames, or None for no encoder
+        encoders: x264 processes fed at once
+        source_size: (width, height) decoded before any downscaling,
+            defaults to frame_size
+    """
+    pixels = frame_size[0] * frame_size[1]
+    source_w, source_h = source_size or frame_size
+    total = BASE_MB * 2**20 + source_w * source_h * DECODER_BYTES_PER_PIXEL
+    total += pixels * 3 * max(1, max_in_flight)
+    if lookahead is not None:
+        per_encoder = ENCODER_BASE_MB * 2**20 + pixels * (
+            X264_BYTES_PER_PIXEL + lookahead * X264_LOOKAHEAD_BYTES_PER_PIXEL
+        )
+        total += encoders * per_encoder
+    return total / 2**20
+
+
+def plan_memory(
+    frame_size: tuple,
+    budget_mb: float,
+    workers: int,
+    preset: str = 'slow',
+    encoders: int = 1,
+    compress: bool = True,
+    source_size: tuple = None
+) -> dict:
+    """
+    Size the frame ring, blend workers, x264 lookahead and encoder count of
+    a job so its estimated peak memory fits in ``budget_mb``.
+
+    Without a budget the defaults are kept. Otherwise costs are cut in the
+    order that hurts least: the ring drops from four to two frames per
+    worker, the lookahead shrinks to MIN_LOOKAHEAD, encoders run in smaller
+    groups, then workers are removed down to the serial path's single
+    frame. A budget too small even for that is run at the minimum and
+    flagged with ``fits`` False, so throughput degrades instead of the job
+    being killed for running out of memory.
+
+    Args:
+        frame_size: (width, height) of the frames blended and encoded
+        budget_mb: Memory for this job in MB, or None for no limit
+        workers: Blend threads requested (1 is serial)
+        preset: x264 preset, which sets the default lookahead
+        encoders: x264 processes fed at once (fan-out)
+        compress: False when frames go to cv2.VideoWriter, not x264
+        source_size: (width, height) decoded before downscaling
+
+    Returns:
+        Dict with workers, max_in_flight, lookahead (None keeps the
+        preset's), encoders, frame_mb, estimated_mb, budget_mb and fits
+    """
+    default_lookahead = X264_LOOKAHEAD.get(preset, MIN_LOOKAHEAD) if compress else None
+    lookahead = default_lookahead
+    in_flight = 1 if workers == 1 else workers * 4
+
+    def estimate():
+        return estimate_mb(frame_size, in_flight, lookahead, encoders, source_size)
+
+    if budget_mb:
+        if workers != 1 and estimate() > budget_mb:
+            in_flight = workers * 2
+        while lookahead is not None and lookahead > MIN_LOOKAHEAD and estimate() > budget_mb:
+            lookahead = max(MIN_LOOKAHEAD, lookahead - 10)
+        while encoders > 1 and estimate() > budget_mb:
+            encoders -= 1
+        while workers != 1 and estimate() > budget_mb:
+            workers = max(1, workers - 1)
+            in_flight = 1 if workers == 1 else workers * 2
+
+    estimated = estimate()
+    return {
+        'workers': workers,
+        'max_in_flight': in_flight,
+        'lookahead': None if lookahead == default_lookahead else lookahead,
+        'encoders': encoders,
+        'frame_mb': round(frame_mb(frame_size), 2),
+        'estimated_mb': round(estimated, 1),
+        'budget_mb': budget_mb,
+        'fits': not budget_mb or estimated <= budget_mb,
+    }
+
+
+def peak_rss_mb() -> dict:
+    """
+    High-water resident memory in MB of this process ('self') and of the
+    largest child it has waited for, e.g. an FFmpeg encoder ('children');
+    None where the platform doesn't report it.
+    """
+    if resource is None:
+        return {'self': None, 'children': None}
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20, 1),
+    }
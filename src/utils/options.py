@@ -0,0 +1,16 @@
+# Names of the settings the processing stages accept. Nothing here imports
+# NumPy, OpenCV or Pillow, so the CLI parser and the GUI menus are built
+# before those load; the stages import these from here.
+
+BACKENDS = ('opencv', 'ffmpeg')
+READERS = ('opencv', 'ffmpeg')
+MOTIONS = ('bounce', 'diagonal', 'random', 'corners')
+INTERPOLATION_NAMES = ('area', 'linear', 'cubic', 'lanczos')  # Keys of decoder.INTERPOLATIONS
+RATE_CONTROLS = ('crf', 'abr', 'two-pass')
+PRESETS = (
+    'ultrafast', 'superfast', 'veryfast', 'faster', 'fast',
+    'medium', 'slow', 'slower', 'veryslow'
+)
+
+# Directory of the on-disk logo store shared with worker processes
+CACHE_DIR_ENV = 'VIDEO_WATERMARKER_LOGO_CACHE'
@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class WatermarkOverlay:
+    """
+    Logo prepared once per job for fast per-frame alpha blending.
+
+    The logo colour is premultiplied by its alpha (and the requested
+    opacity) and stored as uint16 fixed point with 8 fractional bits, so a
+    blend is ``(roi * inverse_alpha + premultiplied) >> 8`` done entirely in
+    integer arithmetic into a reusable scratch buffer.
+
+    Args:
+        logo: BGRA logo image, already resized to its on-screen size
+        opacity: Opacity of watermark (0.0 to 1.0)
+    """
+
+    def __init__(self, logo: np.ndarray, opacity: float = 0.25):
+        if logo.ndim != 3 or logo.shape[2] != 4:
+            raise ValueError("Overlay logo must be a BGRA image")
+
+        alpha = logo[:, :, 3].astype(np.float32) * (float(opacity) / 255.0)
+        alpha = np.rint(np.clip(alpha, 0.0, 1.0) * 256).astype(np.uint16)  # 0..256
+
+        # 128 is folded in so the final shift rounds instead of truncating.
+        # Max value: 255 * 256 + 128 = 65408, which fits in uint16.
+        self.premultiplied = logo[:, :, :3].astype(np.uint16) * alpha[:, :, None] + 128
+        self.inverse_alpha = (256 - alpha)[:, :, None]
+        self.height, self.width = logo.shape[:2]
+        self.opacity = float(opacity)
+
+        self._scratch = self.new_scratch()
+
+    @classmethod
+    def from_arrays(cls, premultiplied: np.ndarray, inverse_alpha: np.ndarray, opacity: float):
+        """
+        Wrap already prepared arrays (e.g. from a cache) without recomputing them.
+
+        The arrays may be shared between overlays; each gets its own scratch buffer.
+        """
+        overlay = cls.__new__(cls)
+        overlay.premultiplied = premultiplied
+        overlay.inverse_alpha = inverse_alpha
+        overlay.height, overlay.width = premultiplied.shape[:2]
+        overlay.opacity = float(opacity)
+        overlay._scratch = overlay.new_scratch()
+        return overlay
+
+    @property
+    def shape(self) -> tuple:
+        return (self.height, self.width)
+
+    def new_scratch(self) -> np.ndarray:
+        """Allocate a blend buffer; each thread blending concurrently needs its own."""
+        return np.empty((self.height, self.width, 3), dtype=np.uint16)
+
+    def blend(self, roi: np.ndarray, scratch: np.ndarray = None) -> np.ndarray:
+        """
+        Blend the overlay into ``roi`` in place.
+
+        A ROI smaller than the overlay is blended with the matching top-left
+        part of the overlay; use blend_at() to place it anywhere in a frame.
+
+        Args:
+            roi: uint8 BGR view into the frame
+            scratch: Optional buffer from new_scratch(); defaults to the
+                overlay's own, which is not safe to share between threads
+        """
+        h, w = roi.shape[:2]
+        return self._blend(roi, 0, 0, h, w, scratch)
+
+    def windows(self, frame_shape: tuple, x: int, y: int) -> list:
+        """The frame slices blend_at(frame, x, y) touches: one, or none if off-frame."""
+        frame_h, frame_w = frame_shape[:2]
+        left, top = max(x, 0), max(y, 0)
+        right = min(x + self.width, frame_w)
+        bottom = min(y + self.height, frame_h)
+        if right <= left or bottom <= top:
+            return []
+        return [(slice(top, bottom), slice(left, right))]
+
+    def blend_at(self, frame: np.ndarray, x: int, y: int, scratch: np.ndarray = None) -> np.ndarray:
+        """
+        Blend the overlay into ``frame`` in place with its top-left corner at (x, y).
+
+        Only the ROI view is touched. Parts of the overlay that fall outside
+        the frame (including negative x/y) are clipped, never resized.
+
+        Args:
+            frame: uint8 BGR frame
+            x: Overlay left edge in frame coordinates
+            y: Overlay top edge in frame coordinates
+            scratch: Optional buffer from new_scratch()
+        """
+        frame_h, frame_w = frame.shape[:2]
+        left, top = max(x, 0), max(y, 0)
+        right = min(x + self.width, frame_w)
+        bottom = min(y + self.height, frame_h)
+        if right <= left or bottom <= top:
+            return frame
+
+        self._blend(frame[top:bottom, left:right], top - y, left - x,
+                    bottom - top, right - left, scratch)
+        return frame
+
+    def _blend(self, roi, oy, ox, h, w, scratch):
+        buf = (self._scratch if scratch is None else scratch)[:h, :w]
+        window = (slice(oy, oy + h), slice(ox, ox + w))
+
+        np.multiply(roi, self.inverse_alpha[window], out=buf)
+        np.add(buf, self.premultiplied[window], out=buf)
+        np.right_shift(buf, 8, out=buf)
+        np.copyto(roi, buf, casting='unsafe')
+        return roi
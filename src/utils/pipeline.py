@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.cancellation import CANCEL_CHECK_FRAMES, CancelToken
+from utils.overlay import WatermarkOverlay
+from utils.progress import ProgressReporter
+from utils.static_skip import BLEND, REMEMBER, REUSE, StaticRegions
+
+
+_END = object()
+
+
+def default_worker_count() -> int:
+    """Blend workers to use when none are requested: one per core, at least one."""
+    return max(1, os.cpu_count() or 1)
+
+
+def run_frame_pipeline(
+    cap,
+    out,
+    overlay: WatermarkOverlay,
+    positions,
+    workers: int = None,
+    max_in_flight: int = None,
+    reporter: ProgressReporter = None,
+    cancel_token: CancelToken = None,
+    skip_static: bool = False
+) -> int:
+    """
+    Decode, blend and encode on separate threads.
+
+    A reader thread pulls frames from ``cap`` and pairs each with the next
+    position from ``positions``, a pool of workers blends them in any order,
+    and the calling thread writes them to ``out`` in frame order. OpenCV and
+    NumPy release the GIL, so the stages overlap on multiple cores.
+
+    Args:
+        cap: Opened cv2.VideoCapture (or anything with read())
+        out: Writer with write(frame), e.g. cv2.VideoWriter or FFmpegWriter
+        overlay: Prepared watermark overlay, or a LayerStack
+        positions: Iterable of per-frame blend_at() arguments, one per
+            frame: (x, y) for an overlay, (placements,) for a LayerStack
+        workers: Number of blend threads (defaults to the core count)
+        max_in_flight: Frames held in memory at once across all stages
+            (defaults to four per worker)
+        reporter: Optional ProgressReporter; decode, blend and encode
+            times are summed over the threads doing them
+        cancel_token: Optional CancelToken polled by the reader and writer
+        skip_static: Reuse the previous frame's blended pixels while the
+            position and the pixels under the overlay are unchanged; the
+            reader detects such frames in decode order and the writer
+            pastes them in output order, so they never reach a worker
+
+    Returns:
+        Number of frames written
+    """
+    reporter = reporter or ProgressReporter()
+    clock = time.perf_counter
+    workers = workers or default_worker_count()
+    max_in_flight = max_in_flight or workers * 4
+
+    # Frames are decoded into a fixed ring of buffers: a buffer is taken
+    # when a frame is read and handed back once it has been written, which
+    # bounds memory no matter which stage is the bottleneck and avoids a
+    # full-frame allocation per frame.
+    free_buffers = queue.Queue()
+    ordered = queue.Queue()
+    stop = threading.Event()
+    local = threading.local()
+    statics = StaticRegions(overlay) if skip_static else None
+
+    def blend(frame, position):
+        started = clock()
+        scratch = getattr(local, 'scratch', None)
+        if scratch is None:
+            scratch = local.scratch = overlay.new_scratch()
+        overlay.blend_at(frame, *position, scratch=scratch)
+        reporter.add_time('blend', clock() - started)
+        return frame
+
+    def take_buffer():
+        while not stop.is_set():
+            try:
+                return free_buffers.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def read_frames(pool):
+        allocated = 0
+        try:
+            for index, position in enumerate(positions):
+                if cancel_token and index % CANCEL_CHECK_FRAMES == 0 and cancel_token.cancelled:
+                    break
+                if allocated < max_in_flight:
+                    # Let OpenCV allocate the ring lazily, one frame at a time
+                    allocated += 1
+                    started = clock()
+                    ret, frame = cap.read()
+                else:
+                    buffer = take_buffer()
+                    if buffer is None:
+                        return
+                    started = clock()
+                    ret, frame = cap.read(buffer)
+                if not ret or stop.is_set():
+                    break
+                reporter.add_time('decode', clock() - started)
+                action = statics.check(frame, position) if statics else BLEND
+                if action == REUSE:
+                    ordered.put((None, frame, position, action))
+                else:
+                    ordered.put((pool.submit(blend, frame, position), frame, position, action))
+        except Exception as e:
+            ordered.put(e)
+        finally:
+            ordered.put(_END)
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        reader = threading.Thread(target=read_frames, args=(pool,), daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = ordered.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if cancel_token and written % CANCEL_CHECK_FRAMES == 0:
+                    cancel_token.raise_if_cancelled()
+                future, frame, position, action = item
+                if action == REUSE:
+                    started = clock()
+                    statics.reuse(frame, position)
+                    reporter.add_time('blend', clock() - started)
+                else:
+                    frame = future.result()
+                    if action == REMEMBER:
+                        statics.remember(frame, position)
+                started = clock()
+                out.write(frame)
+                reporter.add_time('encode', clock() - started)
+                written += 1
+                free_buffers.put(frame)
+                reporter.advance()
+        finally:
+            stop.set()
+            reader.join()
+
+    if cancel_token:
+        # The reader stops early on cancel; don't report a short read as success
+        cancel_token.raise_if_cancelled()
+    return written
@@ -0,0 +1,129 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from utils.logo_cache import get_logo_cache
+from utils.trajectory import make_trajectory
+
+
+class PreviewClip:
+    """
+    The first few seconds of a video, decoded once and downscaled.
+
+    Args:
+        frames: Preview-sized BGR frames
+        fps: Frame rate of the source
+        frame_size: (width, height) of the source video
+    """
+
+    def __init__(self, frames: list, fps: float, frame_size: tuple):
+        self.frames = frames
+        self.fps = fps
+        self.frame_size = frame_size
+        self.ratio = frames[0].shape[1] / frame_size[0] if frames else 1.0
+
+
+class PreviewRenderer:
+    """
+    Watermarked preview frames for tuning scale, speed and opacity without
+    a full render.
+
+    Clips are decoded at reduced resolution and kept in an in-memory LRU,
+    so moving a slider only re-blends one small frame with the cached
+    overlay. Positions come from the same trajectory as the real render,
+    computed at full resolution and scaled down, so the logo follows the
+    path it will take in the output.
+
+    Args:
+        max_width: Width frames are downscaled to (never upscaled)
+        seconds: Length of video decoded per clip
+        max_clips: Clips kept in memory
+    """
+
+    def __init__(self, max_width: int = 640, seconds: float = 3.0, max_clips: int = 2):
+        self.max_width = max_width
+        self.seconds = seconds
+        self.max_clips = max_clips
+        self._clips = OrderedDict()
+        self._lock = threading.Lock()
+        self._canvas = None
+
+    def clip(self, input_video_path: str) -> PreviewClip:
+        """Decoded preview clip for a video, from the cache when possible."""
+        stat = os.stat(input_video_path)
+        key = (os.path.abspath(input_video_path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            clip = self._clips.get(key)
+            if clip is not None:
+                self._clips.move_to_end(key)
+                return clip
+
+        clip = self._decode(input_video_path)
+        with self._lock:
+            self._clips[key] = clip
+            while len(self._clips) > self.max_clips:
+                self._clips.popitem(last=False)
+        return clip
+
+    def _decode(self, input_video_path: str) -> PreviewClip:
+        cap = cv2.VideoCapture(input_video_path)
+        if not cap.isOpened():
+            raise FileNotFoundError(f"Cannot open video: {input_video_path}")
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+        preview_w = min(width, self.max_width)
+        preview_size = (preview_w, max(1, int(round(height * preview_w / width))))
+        frames = []
+        buffer = None
+        try:
+            while len(frames) < max(1, int(self.seconds * fps)):
+                ret, buffer = cap.read(buffer) if buffer is not None else cap.read()
+                if not ret:
+                    break
+                frames.append(cv2.resize(buffer, preview_size, interpolation=cv2.INTER_AREA))
+        finally:
+            cap.release()
+        if not frames:
+            raise ValueError(f"No frames decoded from: {input_video_path}")
+        return PreviewClip(frames, fps, (width, height))
+
+    def render(
+        self,
+        input_video_path: str,
+        logo_path: str,
+        frame_index: int,
+        scale: float = 0.08,
+        speed: int = 5,
+        opacity: float = 0.25,
+        motion: str = 'bounce',
+        motion_options: dict = None
+    ) -> np.ndarray:
+        """
+        Preview frame ``frame_index`` (wrapping around the clip) with the
+        watermark blended in. The returned array is reused by the next call.
+        """
+        clip = self.clip(input_video_path)
+        width, height = clip.frame_size
+        index = frame_index % len(clip.frames)
+
+        # Full-size logo for the trajectory, preview-size logo for blending
+        logo_cache = get_logo_cache()
+        logo_h = int(height * float(scale))
+        full = logo_cache.get(logo_path, logo_h, opacity)
+        overlay = logo_cache.get(logo_path, max(1, int(round(logo_h * clip.ratio))), opacity)
+        trajectory = make_trajectory(
+            motion, width, height, full.width, full.height,
+            speed=int(speed), fps=clip.fps, **(motion_options or {})
+        )
+        x, y = trajectory.position(index)
+
+        frame = clip.frames[index]
+        if self._canvas is None or self._canvas.shape != frame.shape:
+            self._canvas = np.empty_like(frame)
+        np.copyto(self._canvas, frame)
+        return overlay.blend_at(self._canvas, int(round(x * clip.ratio)), int(round(y * clip.ratio)))
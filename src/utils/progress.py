@@ -0,0 +1,157 @@
+import json
+import logging
+import subprocess
+import tempfile
+import threading
+import time
+
+from utils.cancellation import CancelToken
+
+logger = logging.getLogger('video_watermarker')
+
+
+class ProgressReporter:
+    """
+    Tracks frames done, throughput and cumulative time per stage, and hands
+    a snapshot to ``callback`` at most every ``interval`` seconds.
+
+    Stage times (e.g. decode, blend, encode) are summed across threads, so
+    in the threaded pipeline they can add up to more than the elapsed time;
+    the largest one is the bottleneck.
+
+    Args:
+        callback: Called with a snapshot dict (see snapshot()); may be None
+        stage: Name of the job phase being reported, e.g. 'watermark'
+        total_frames: Expected frame count (0 if unknown)
+        interval: Minimum seconds between callbacks
+    """
+
+    def __init__(self, callback=None, stage: str = 'watermark', total_frames: int = 0, interval: float = 1.0):
+        self.callback = callback
+        self.stage = stage
+        self.total_frames = max(0, int(total_frames or 0))
+        self.interval = interval
+        self.frames_done = 0
+        self.stage_seconds = {}
+        self._fraction = None
+        self._started = time.perf_counter()
+        self._last_emit = 0.0
+        self._lock = threading.Lock()
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    def advance(self, frames: int = 1):
+        """Count finished frames and report if the interval has passed."""
+        with self._lock:
+            self.frames_done += frames
+        self._maybe_emit()
+
+    def update(self, frames_done: int = None, fraction: float = None):
+        """Set absolute progress, e.g. from FFmpeg's -progress output."""
+        with self._lock:
+            if frames_done is not None:
+                self.frames_done = frames_done
+            if fraction is not None:
+                self._fraction = min(1.0, max(0.0, fraction))
+        self._maybe_emit()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            fraction = self._fraction
+            if fraction is None and self.total_frames:
+                fraction = min(1.0, self.frames_done / self.total_frames)
+            fps = self.frames_done / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if fraction:
+                eta = elapsed * (1 - fraction) / fraction
+            return {
+                'stage': self.stage,
+                'frames_done': self.frames_done,
+                'total_frames': self.total_frames,
+                'fraction': round(fraction, 4) if fraction is not None else None,
+                'fps': round(fps, 2),
+                'elapsed_seconds': round(elapsed, 3),
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'stage_seconds': {k: round(v, 3) for k, v in self.stage_seconds.items()},
+            }
+
+    def finish(self) -> dict:
+        """Report the final numbers regardless of the interval and return them."""
+        with self._lock:
+            if self.total_frames and self._fraction is None:
+                self._fraction = min(1.0, self.frames_done / self.total_frames)
+        report = self.snapshot()
+        if self.callback:
+            self.callback(report)
+        return report
+
+    def _maybe_emit(self):
+        if not self.callback:
+            return
+        now = time.perf_counter()
+        if now - self._last_emit < self.interval:
+            return
+        self._last_emit = now
+        self.callback(self.snapshot())
+
+
+def log_progress(report: dict, job: str = None):
+    """
+    Progress callback for headless runs: one JSON object per log line,
+    tagged with ``job`` (e.g. the input path) when several run at once.
+    """
+    if job is not None:
+        report = dict(report, job=job)
+    logger.info(json.dumps(report, sort_keys=True))
+
+
+def configure_logging(level: int = logging.INFO):
+    """Send log records to stderr unless the process already has handlers."""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=level, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+
+
+def run_ffmpeg(cmd: list, reporter: ProgressReporter = None, duration: float = None,
+               cancel_token: CancelToken = None):
+    """
+    Run an FFmpeg command, feeding its ``-progress`` output to ``reporter``.
+
+    Frames come from ``frame=`` and the completed fraction from
+    ``out_time_us=`` relative to ``duration``. Raises CalledProcessError
+    like subprocess.run(check=True) if FFmpeg fails, or ProcessingCancelled
+    if ``cancel_token`` terminated it.
+    """
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    if reporter is None and cancel_token is None:
+        subprocess.run(cmd, check=True)
+        return
+    reporter = reporter or ProgressReporter()
+
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + cmd[1:]
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        if cancel_token:
+            cancel_token.register(proc)
+        frames = None
+        for raw in proc.stdout:
+            key, _, value = raw.decode('utf-8', errors='replace').strip().partition('=')
+            if key == 'frame' and value.isdigit():
+                frames = int(value)
+            elif key == 'out_time_us' and value.lstrip('-').isdigit():
+                fraction = int(value) / 1e6 / duration if duration else None
+                reporter.update(frames_done=frames, fraction=fraction)
+            elif key == 'progress' and value == 'end':
+                reporter.update(frames_done=frames, fraction=1.0)
+        returncode = proc.wait()
+        reporter.add_time('ffmpeg', time.perf_counter() - started)
+        if cancel_token:
+            cancel_token.unregister(proc)
+            cancel_token.raise_if_cancelled()
+        if returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr.read())
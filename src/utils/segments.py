@@ -0,0 +1,436 @@
+import contextlib
+import glob
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from itertools import islice
+
+import cv2
+
+from utils.cancellation import CancelToken, ProcessingCancelled, remove_partial_output
+from utils.compression import (
+    FFmpegWriter, audio_stream_args, encode_report, predicted_size_mb, size_target
+)
+from utils.decoder import ScaledCapture, output_size
+from utils.jobs import atomic_output, layer_files
+from utils.layers import LayerStack, build_stack
+from utils.logo_cache import get_logo_cache
+from utils.media_info import probe_media
+from utils.memory import peak_rss_mb, plan_memory
+from utils.progress import ProgressReporter
+from utils.watermark import watermark_frames
+
+
+def probe_keyframe_times(input_video_path: str) -> list:
+    """
+    Return the presentation times (seconds) of the video's keyframes.
+
+    Reads packet flags with FFprobe, so nothing is decoded.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0',
+        input_video_path
+    ]
+    output = subprocess.check_output(cmd).decode('utf-8')
+
+    times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.strip().partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            times.append(float(pts_time))
+    return sorted(times)
+
+
+def plan_segments(keyframes: list, frame_count: int, segments: int) -> list:
+    """
+    Split frames 0..frame_count into about ``segments`` keyframe-aligned ranges.
+
+    Args:
+        keyframes: Frame indices of keyframes
+        frame_count: Total number of frames
+        segments: Desired number of segments
+
+    Returns:
+        List of (start, end) frame ranges; the last end is None (until EOF)
+    """
+    candidates = sorted(k for k in set(keyframes) if 0 < k < frame_count)
+    starts = [0]
+    for i in range(1, segments):
+        if not candidates:
+            break
+        ideal = frame_count * i / segments
+        nearest = min(candidates, key=lambda k: abs(k - ideal))
+        if nearest > starts[-1]:
+            starts.append(nearest)
+
+    ends = starts[1:] + [None]
+    return list(zip(starts, ends))
+
+
+# Set in each worker process by _init_segment_worker
+_worker_token = None
+_worker_frames = None
+
+
+def _init_segment_worker(cancel_event, frames_done):
+    # A CancelToken can't cross processes, so each worker mirrors the
+    # parent's cancel event into its own token (which also stops its FFmpeg)
+    global _worker_token, _worker_frames
+    _worker_token = CancelToken()
+    _worker_frames = frames_done
+
+    def watch():
+        cancel_event.wait()
+        _worker_token.cancel()
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+class _SegmentReporter(ProgressReporter):
+    """Also counts frames into the counter the parent process reports from."""
+
+    def __init__(self, frames_done):
+        super().__init__()
+        self._frames_done = frames_done
+
+    def advance(self, frames: int = 1):
+        super().advance(frames)
+        if self._frames_done is not None:
+            with self._frames_done.get_lock():
+                self._frames_done.value += frames
+
+
+def _render_segment(job: dict) -> dict:
+    # Runs in a worker process: everything is rebuilt from plain arguments.
+    # OpenCV is used to decode, as only it can seek to the segment's start.
+    cap = cv2.VideoCapture(job['input_video_path'])
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Cannot open video: {job['input_video_path']}")
+
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    start, end = job['start'], job['end']
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    size = output_size(width, height, job['output_height'], job['max_size'])
+    if size != (width, height):
+        cap = ScaledCapture(cap, size, job['interpolation'])
+        width, height = size
+
+    stack = build_stack(
+        job['logo_path'], job['layers'], width, height, fps, job['scale'], job['opacity'],
+        job['motion'], job['speed'], job['motion_options']
+    )
+
+    # Trajectories are indexed by absolute frame number, so motion carries
+    # on seamlessly from the previous segment.
+    if len(stack) == 1:
+        overlay, positions = stack[0].overlay, stack[0].trajectory.positions(start)
+    else:
+        overlay = LayerStack(stack)
+        positions = overlay.positions(start)
+    if end is not None:
+        positions = islice(positions, end - start)
+
+    reporter = _SegmentReporter(_worker_frames)
+    # Renamed into place once complete, so an existing segment is a finished one
+    with atomic_output(job['segment_path']) as segment_path:
+        out = FFmpegWriter(
+            segment_path, (width, height), fps, quality=job['quality'], preset=job['preset'],
+            rate_control=job['rate_control'], bitrate_kbps=job['bitrate_kbps'],
+            cancel_token=_worker_token, lookahead=job['lookahead']
+        )
+        try:
+            watermark_frames(cap, out, overlay, positions, workers=1, reporter=reporter, cancel_token=_worker_token)
+        finally:
+            cap.release()
+            out.release()
+    return reporter.finish()['stage_seconds']
+
+
+def _segment_processes(frame_size: tuple, source_size: tuple, budget_mb: float, processes: int,
+                       preset: str) -> tuple:
+    """Processes that fit ``budget_mb`` side by side, and the x264 lookahead each can use."""
+    while True:
+        memory = plan_memory(frame_size, budget_mb / processes, 1, preset, source_size=source_size)
+        if memory['fits'] or processes == 1:
+            return processes, memory
+        processes -= 1
+
+
+def _prepare_work_dir(work_dir: str, plan: dict):
+    # Segments from a run with a different input, plan or settings are stale
+    os.makedirs(work_dir, exist_ok=True)
+    plan_path = os.path.join(work_dir, 'plan.json')
+    try:
+        with open(plan_path, encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = None
+    if previous == plan:
+        return
+    for path in _segment_files(work_dir):
+        os.remove(path)
+    with atomic_output(plan_path) as path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f)
+
+
+def _segment_files(work_dir: str) -> list:
+    """Segments rendered into ``work_dir`` (see the jobs' segment_path)."""
+    return glob.glob(os.path.join(glob.escape(work_dir), 'segment_[0-9][0-9][0-9][0-9][0-9].mp4'))
+
+
+def _clean_work_dir(work_dir: str):
+    # Only what _prepare_work_dir and the workers wrote: the directory may
+    # be the caller's and hold other files
+    remove_partial_output(os.path.join(work_dir, 'plan.json'), *_segment_files(work_dir))
+    try:
+        os.rmdir(work_dir)
+    except OSError:  # Not empty
+        pass
+
+
+def concat_segments(segment_paths: list, output_video_path: str, audio_source_path: str = None):
+    """
+    Losslessly join encoded segments with FFmpeg's concat demuxer,
+    copying in the audio of ``audio_source_path`` if it has any.
+    """
+    list_path = output_video_path + '.segments.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+    if audio_source_path:
+        cmd += ['-i', audio_source_path, '-map', '0:v:0', '-map', '1:a:0?']
+    audio_args, _ = audio_stream_args(audio_source_path, output_video_path)
+    cmd += ['-c:v', 'copy'] + audio_args + [output_video_path]
+
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        os.remove(list_path)
+
+
+def add_moving_watermark_segmented(
+    input_video_path: str,
+    logo_path: str,
+    output_video_path: str,
+    speed: int = 5,
+    scale: float = 0.08,
+    opacity: float = 0.25,
+    quality: int = 23,
+    processes: int = None,
+    segments: int = None,
+    motion: str = 'bounce',
+    motion_options: dict = None,
+    work_dir: str = None,
+    target_size_mb: float = 10.0,
+    rate_control: str = 'crf',
+    preset: str = 'slow',
+    layers: list = None,
+    progress=None,
+    cancel_token: CancelToken = None,
+    output_height: int = None,
+    max_size: tuple = None,
+    interpolation: str = 'area',
+    memory_budget_mb: float = None
+) -> dict:
+    """
+    Watermark a long video by splitting it at keyframes and rendering the
+    segments in parallel processes, then concatenating them without
+    re-encoding.
+
+    With a ``work_dir`` the finished segments survive a crash, and running
+    again with the same directory and settings only renders the segments
+    that were not finished.
+
+    Args:
+        input_video_path: Path to input video
+        logo_path: Path to watermark image (may be None with ``layers``)
+        output_video_path: Path to save watermarked video
+        speed: Speed of watermark movement (pixels per frame)
+        scale: Size of watermark relative to video height
+        opacity: Opacity of watermark (0.0 to 1.0)
+        quality: CRF value (0-51, lower is better quality)
+        processes: Worker processes (defaults to the core count)
+        segments: Number of segments (defaults to the number of processes)
+        motion: Motion pattern ('bounce', 'diagonal', 'random', 'corners')
+        motion_options: Extra make_trajectory() arguments, e.g. hold_seconds
+        work_dir: Directory kept for segments until the output is written
+            (defaults to a temporary directory next to the output); then
+            only the segments and plan are removed from it, and the
+            directory itself if that leaves it empty
+        target_size_mb: Target file size in MB for 'abr'
+        rate_control: 'crf' or 'abr'; every segment gets the bitrate of the
+            whole file ('two-pass' is not supported)
+        preset: x264 preset
+        layers: Extra image/text layers (see build_layers)
+        progress: Optional callback receiving ProgressReporter snapshots
+            of the frames done by all processes together
+        cancel_token: Optional CancelToken; cancelling stops every process
+            and their FFmpeg encoders and raises ProcessingCancelled
+            (finished segments are kept in ``work_dir``)
+        output_height: Downscale frames to this height (see open_video)
+        max_size: Alternatively or also, (width, height) to fit within
+        interpolation: Scaling filter, one of INTERPOLATIONS
+        memory_budget_mb: Peak memory to stay within; each process decodes
+            and encodes on its own, so fewer run at once and their x264
+            lookahead is cut until their share fits (see plan_memory)
+
+    Returns:
+        Predicted versus actual size report, with the time per stage summed
+        over all processes, the memory plan and peak_rss_mb
+    """
+    if rate_control == 'two-pass':
+        raise ValueError("Segments are encoded in a single pass; use 'crf' or 'abr'")
+    if not logo_path and not layers:
+        raise ValueError("A logo or at least one layer is required")
+    processes = processes or os.cpu_count() or 1
+    segments = segments or processes
+
+    try:
+        info = probe_media(input_video_path)
+    except FileNotFoundError:
+        info = None
+    if info is None or not info.has_video:
+        raise FileNotFoundError(f"Cannot open video: {input_video_path}")
+    fps = info.fps
+    frame_count = info.frame_count
+    frame_size = output_size(info.width, info.height, output_height, max_size)
+
+    memory = None
+    lookahead = None
+    if memory_budget_mb:
+        processes, memory = _segment_processes(
+            frame_size, (info.width, info.height), memory_budget_mb, processes, preset
+        )
+        lookahead = memory['lookahead']
+
+    duration = frame_count / fps if fps else 0
+    bitrate_kbps, audio_kbps = size_target(
+        input_video_path, output_video_path, rate_control, target_size_mb, duration
+    )
+
+    keyframe_times = probe_keyframe_times(input_video_path)
+    first = keyframe_times[0] if keyframe_times else 0.0
+    keyframes = [int(round((t - first) * fps)) for t in keyframe_times]
+    ranges = plan_segments(keyframes, frame_count, segments)
+
+    # Segments live next to the output so the final concat stays on one disk
+    output_dir = os.path.dirname(os.path.abspath(output_video_path))
+    if work_dir:
+        segments_dir = contextlib.nullcontext(work_dir)
+    else:
+        segments_dir = tempfile.TemporaryDirectory(dir=output_dir, prefix='.segments-')
+    stage_seconds = {}
+    with segments_dir as tmp:
+        jobs = [
+            {
+                'input_video_path': input_video_path,
+                'logo_path': logo_path,
+                'segment_path': os.path.join(tmp, f'segment_{i:05d}.mp4'),
+                'start': start,
+                'end': end,
+                'speed': int(speed),
+                'scale': scale,
+                'opacity': opacity,
+                'quality': quality,
+                'motion': motion,
+                'motion_options': motion_options or {},
+                'layers': layers or [],
+                'rate_control': rate_control,
+                'bitrate_kbps': bitrate_kbps,
+                'preset': preset,
+                'lookahead': lookahead,
+                'output_height': output_height,
+                'max_size': list(max_size) if max_size else None,
+                'interpolation': interpolation,
+            }
+            for i, (start, end) in enumerate(ranges)
+        ]
+
+        pending = jobs
+        if work_dir:
+            stat = os.stat(input_video_path)
+            _prepare_work_dir(work_dir, {
+                'input': [os.path.abspath(input_video_path), stat.st_mtime_ns, stat.st_size],
+                'logo': get_logo_cache().digest(logo_path) if logo_path else None,
+                'layers': [get_logo_cache().digest(path) for path in layer_files(layers)],
+                'jobs': [{k: v for k, v in job.items() if k != 'segment_path'} for job in jobs],
+            })
+            pending = [job for job in jobs if not os.path.isfile(job['segment_path'])]
+
+        if pending:
+            total = sum((frame_count if job['end'] is None else job['end']) - job['start'] for job in pending)
+            stage_seconds = _render_segments(pending, processes, total, progress, cancel_token)
+
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        with atomic_output(output_video_path) as path:
+            started = time.perf_counter()
+            concat_segments([job['segment_path'] for job in jobs], path, input_video_path)
+            stage_seconds['concat'] = round(time.perf_counter() - started, 3)
+    if work_dir:
+        _clean_work_dir(work_dir)
+
+    predicted_mb = predicted_size_mb(rate_control, bitrate_kbps, duration, audio_kbps)
+    report = encode_report(output_video_path, rate_control, preset, predicted_mb)
+    report['stage_seconds'] = stage_seconds
+    report['memory'] = memory
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def _render_segments(jobs: list, processes: int, total_frames: int, progress, cancel_token) -> dict:
+    """Render ``jobs`` in a process pool; returns the time per stage summed over them."""
+    context = multiprocessing.get_context()
+    cancel_event = context.Event()
+    frames_done = context.Value('q', 0)
+    reporter = ProgressReporter(progress, 'segments', total_frames)
+    stage_seconds = {}
+
+    with ProcessPoolExecutor(
+        max_workers=min(processes, len(jobs)),
+        initializer=_init_segment_worker, initargs=(cancel_event, frames_done)
+    ) as pool:
+        futures = [pool.submit(_render_segment, job) for job in jobs]
+        pending = futures
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.25, return_when=FIRST_EXCEPTION)
+                reporter.update(frames_done=frames_done.value)
+                if (cancel_token and cancel_token.cancelled) or any(f.exception() for f in done):
+                    break
+        finally:
+            if pending:
+                # Cancelled, or a segment failed: stop the others too
+                cancel_event.set()
+                for future in pending:
+                    future.cancel()
+                wait(pending)
+
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    finished = [future for future in futures if not future.cancelled()]
+    errors = [future.exception() for future in finished if future.exception()]
+    if errors:
+        # Segments stopped because another one failed raise ProcessingCancelled
+        raise min(errors, key=lambda e: isinstance(e, ProcessingCancelled))
+    for future in finished:
+        for name, seconds in future.result().items():
+            stage_seconds[name] = round(stage_seconds.get(name, 0.0) + seconds, 3)
+
+    reporter.update(frames_done=frames_done.value)
+    reporter.finish()
+    return stage_seconds
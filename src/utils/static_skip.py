@@ -0,0 +1,70 @@
+import numpy as np
+
+# Returned by StaticRegions.check() for each frame, in decode order
+BLEND = 0     # Blend as usual
+REMEMBER = 1  # Blend, then remember() the result for the frames after it
+REUSE = 2     # Output pixels are unchanged: reuse() instead of blending
+
+# Rows/columns skipped by the sampled comparison that runs before the
+# exact one, so a changed region is usually rejected after reading 1/64 of it
+SAMPLE_STEP = 8
+
+
+def same_pixels(a: np.ndarray, b: np.ndarray) -> bool:
+    """Exact comparison that first checks a sparse sample of the pixels."""
+    return (np.array_equal(a[::SAMPLE_STEP, ::SAMPLE_STEP], b[::SAMPLE_STEP, ::SAMPLE_STEP])
+            and np.array_equal(a, b))
+
+
+class StaticRegions:
+    """
+    Skips re-blending while both the watermark and the pixels under it hold still.
+
+    Screen recordings and slides repeat the same frame for seconds, and
+    holding trajectories keep the logo in place meanwhile. Blending only
+    depends on the position and on the source pixels in the overlay's
+    windows, so when neither changed since the previous frame the blended
+    windows are copied from that frame instead of computed again. The
+    comparison is exact, so output is identical to blending every frame.
+
+    check() must see the frames in decode order, before they are blended;
+    remember() and reuse() must run in output order. Only frames whose
+    position repeats are tracked, so a moving logo costs one tuple
+    comparison per frame.
+
+    Args:
+        overlay: WatermarkOverlay or LayerStack being blended
+    """
+
+    def __init__(self, overlay):
+        self.overlay = overlay
+        self.reused = 0
+        self._position = None
+        self._sources = None
+        self._blended = None
+
+    def check(self, frame: np.ndarray, position: tuple) -> int:
+        """Decide what to do with a freshly decoded (unblended) frame."""
+        if position != self._position:
+            self._position = position
+            self._sources = None
+            return BLEND
+
+        windows = self.overlay.windows(frame.shape, *position)
+        if self._sources is not None and all(
+            same_pixels(frame[window], source) for window, source in zip(windows, self._sources)
+        ):
+            self.reused += 1
+            return REUSE
+        self._sources = [frame[window].copy() for window in windows]
+        return REMEMBER
+
+    def remember(self, frame: np.ndarray, position: tuple):
+        """Keep the blended windows of a frame check() returned REMEMBER for."""
+        self._blended = [frame[window].copy() for window in self.overlay.windows(frame.shape, *position)]
+
+    def reuse(self, frame: np.ndarray, position: tuple) -> np.ndarray:
+        """Paste the remembered blended windows into a frame check() returned REUSE for."""
+        for window, blended in zip(self.overlay.windows(frame.shape, *position), self._blended):
+            frame[window] = blended
+        return frame
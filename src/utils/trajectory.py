@@ -0,0 +1,273 @@
+import abc
+
+import numpy as np
+
+from utils.options import MOTIONS
+
+
+class Trajectory(abc.ABC):
+    """
+    Logo position as a pure function of the frame index.
+
+    Any frame's position can be computed without replaying earlier frames,
+    so a video can be seeked, split into chunks or blended out of order.
+    Subclasses implement _positions(); those that set ``supports_ffmpeg``
+    also implement ffmpeg_expressions().
+
+    Args:
+        width: Frame width
+        height: Frame height
+        logo_w: Logo width
+        logo_h: Logo height
+    """
+
+    # Whether ffmpeg_expressions() can reproduce the trajectory in FFmpeg
+    supports_ffmpeg = False
+
+    def __init__(self, width: int, height: int, logo_w: int, logo_h: int):
+        # Largest top-left coordinate that keeps the logo inside the frame;
+        # a logo larger than the frame is pinned to 0 on that axis.
+        self.max_x = max(0, int(width) - int(logo_w))
+        self.max_y = max(0, int(height) - int(logo_h))
+
+    @abc.abstractmethod
+    def _positions(self, indices: np.ndarray) -> tuple:
+        """Return (xs, ys) integer arrays for an array of frame indices."""
+
+    def position(self, index: int) -> tuple:
+        """(x, y) of the logo's top-left corner for one frame."""
+        xs, ys = self._positions(np.array([index], dtype=np.int64))
+        return int(xs[0]), int(ys[0])
+
+    def table(self, count: int, start: int = 0) -> np.ndarray:
+        """Positions for frames start..start+count-1 as an int32 (count, 2) array."""
+        indices = np.arange(start, start + count, dtype=np.int64)
+        xs, ys = self._positions(indices)
+        return np.stack([xs, ys], axis=1).astype(np.int32)
+
+    def ffmpeg_expressions(self, index: str = 'n') -> tuple:
+        """
+        (x, y) expressions for FFmpeg's overlay filter that reproduce this
+        trajectory exactly, in terms of ``index``, an expression that
+        evaluates to the 0-based frame index; None unless ``supports_ffmpeg``.
+        """
+        return None
+
+    def positions(self, start: int = 0, block: int = 1024):
+        """Yield (x, y) for every frame from ``start`` onwards, forever."""
+        while True:
+            for x, y in self.table(block, start).tolist():
+                yield x, y
+            start += block
+
+
+class BounceTrajectory(Trajectory):
+    """
+    The classic bouncing logo, bit-exact with the original step-by-step
+    loop that flipped dx/dy at the edges and clamped to the frame.
+
+    That loop walks 0 -> s, 2s, ... clamped to max, then back down clamped
+    to 0, so each axis is a triangle wave with period 2 * ceil(max / s),
+    offset by one frame because frame 0 bounces off the starting edge.
+
+    Args:
+        speed: Speed of watermark movement (pixels per frame)
+    """
+
+    supports_ffmpeg = True
+
+    def __init__(self, width: int, height: int, logo_w: int, logo_h: int, speed: int = 5):
+        super().__init__(width, height, logo_w, logo_h)
+        self.speed = int(speed)
+
+    def _axis(self, indices: np.ndarray, limit: int) -> np.ndarray:
+        step = abs(self.speed)
+        if limit <= 0 or step == 0:
+            return np.zeros(indices.shape, dtype=np.int64)
+
+        # A negative speed bounces into the frame on frame 0 instead of frame 1
+        if self.speed < 0:
+            indices = indices + 1
+
+        rise = -(-limit // step)  # ceil(limit / step) frames up, as many down
+        t = (indices - 1) % (2 * rise)
+        up = np.minimum((t + 1) * step, limit)
+        down = np.maximum(limit - (t - rise + 1) * step, 0)
+        return np.where(t < rise, up, down)
+
+    def _positions(self, indices):
+        return self._axis(indices, self.max_x), self._axis(indices, self.max_y)
+
+    def _axis_expression(self, limit: int, index: str) -> str:
+        step = abs(self.speed)
+        if limit <= 0 or step == 0:
+            return '0'
+        rise = -(-limit // step)
+        # Same triangle wave as _axis(); FFmpeg's mod() floors like Python's %
+        t = f"mod({index}{'' if self.speed < 0 else '-1'},{2 * rise})"
+        return (f"if(lt({t},{rise}),min(({t}+1)*{step},{limit}),"
+                f"max({limit}-({t}-{rise}+1)*{step},0))")
+
+    def ffmpeg_expressions(self, index='n'):
+        return self._axis_expression(self.max_x, index), self._axis_expression(self.max_y, index)
+
+
+class DiagonalSweepTrajectory(Trajectory):
+    """
+    Sweep from the top-left to the bottom-right corner, then start over.
+
+    Args:
+        speed: Pixels per frame along the longer axis
+    """
+
+    supports_ffmpeg = True
+
+    def __init__(self, width: int, height: int, logo_w: int, logo_h: int, speed: int = 5):
+        super().__init__(width, height, logo_w, logo_h)
+        self.speed = max(0, int(speed))
+
+    def _positions(self, indices):
+        length = max(self.max_x, self.max_y)
+        if length == 0:
+            zeros = np.zeros(indices.shape, dtype=np.int64)
+            return zeros, zeros
+        progress = (indices * self.speed) % (length + 1)
+        xs = (progress * self.max_x + length // 2) // length
+        ys = (progress * self.max_y + length // 2) // length
+        return xs, ys
+
+    def ffmpeg_expressions(self, index='n'):
+        length = max(self.max_x, self.max_y)
+        if length == 0:
+            return '0', '0'
+        progress = f"mod({index}*{self.speed},{length + 1})"
+        return tuple(
+            f"floor(({progress}*{limit}+{length // 2})/{length})"
+            for limit in (self.max_x, self.max_y)
+        )
+
+
+class RandomJumpTrajectory(Trajectory):
+    """
+    Jump to a random position every ``hold_frames`` frames.
+
+    Positions come from a counter-based hash of (seed, jump number) rather
+    than a sequential RNG, so any frame can be computed on its own and every
+    chunk of a video agrees on where the logo is.
+
+    Args:
+        hold_frames: Frames to stay at each position
+        seed: Seed for the position sequence
+    """
+
+    def __init__(self, width: int, height: int, logo_w: int, logo_h: int,
+                 hold_frames: int = 150, seed: int = 0):
+        super().__init__(width, height, logo_w, logo_h)
+        self.hold_frames = max(1, int(hold_frames))
+        self.seed = int(seed)
+
+    @staticmethod
+    def _mix(values: np.ndarray) -> np.ndarray:
+        # splitmix64 finaliser
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+    def _positions(self, indices):
+        jump = indices // self.hold_frames
+        with np.errstate(over='ignore'):
+            key = self._mix(jump * 2 + (self.seed << 32))
+            xs = key % np.uint64(self.max_x + 1)
+            ys = self._mix(key) % np.uint64(self.max_y + 1)
+        return xs.astype(np.int64), ys.astype(np.int64)
+
+
+class CornerTrajectory(Trajectory):
+    """
+    Hold the logo in a corner, cycling through ``corners`` every
+    ``hold_frames`` frames (a single corner keeps it fixed).
+
+    Args:
+        corners: Sequence of 'top-left', 'top-right', 'bottom-left', 'bottom-right'
+        hold_frames: Frames to stay in each corner
+        margin: Distance from the frame edges in pixels
+    """
+
+    CORNERS = ('top-left', 'top-right', 'bottom-right', 'bottom-left')
+
+    supports_ffmpeg = True
+
+    def __init__(self, width: int, height: int, logo_w: int, logo_h: int,
+                 corners=('bottom-right',), hold_frames: int = 150, margin: int = 10):
+        super().__init__(width, height, logo_w, logo_h)
+        if isinstance(corners, str):
+            corners = (corners,)
+        unknown = [c for c in corners if c not in self.CORNERS]
+        if not corners or unknown:
+            raise ValueError(f"Unknown corner(s) {unknown}; choose from {self.CORNERS}")
+
+        margin_x = min(int(margin), self.max_x // 2)
+        margin_y = min(int(margin), self.max_y // 2)
+        self._xs = np.array([
+            self.max_x - margin_x if c.endswith('right') else margin_x for c in corners
+        ], dtype=np.int64)
+        self._ys = np.array([
+            self.max_y - margin_y if c.startswith('bottom') else margin_y for c in corners
+        ], dtype=np.int64)
+        self.hold_frames = max(1, int(hold_frames))
+
+    def _positions(self, indices):
+        slot = (indices // self.hold_frames) % len(self._xs)
+        return self._xs[slot], self._ys[slot]
+
+    def ffmpeg_expressions(self, index='n'):
+        slot = f"mod(floor({index}/{self.hold_frames}),{len(self._xs)})"
+
+        def pick(values):
+            # Nested if(eq(slot, i), value_i, ...) over the corner list
+            expr = str(int(values[-1]))
+            for i in range(len(values) - 2, -1, -1):
+                expr = f"if(eq({slot},{i}),{int(values[i])},{expr})"
+            return expr
+
+        return pick(self._xs), pick(self._ys)
+
+
+def make_trajectory(
+    motion: str,
+    width: int,
+    height: int,
+    logo_w: int,
+    logo_h: int,
+    speed: int = 5,
+    fps: float = 30.0,
+    hold_seconds: float = 5.0,
+    corners=('bottom-right',),
+    seed: int = 0
+) -> Trajectory:
+    """
+    Build the trajectory for a motion pattern.
+
+    Args:
+        motion: One of MOTIONS
+        width: Frame width
+        height: Frame height
+        logo_w: Logo width
+        logo_h: Logo height
+        speed: Pixels per frame for 'bounce' and 'diagonal'
+        fps: Frame rate, used to turn hold_seconds into frames
+        hold_seconds: Time between jumps for 'random' and 'corners'
+        corners: Corner(s) to visit for 'corners'
+        seed: Seed for 'random'
+    """
+    hold_frames = max(1, int(round(hold_seconds * (fps or 30.0))))
+    if motion == 'bounce':
+        return BounceTrajectory(width, height, logo_w, logo_h, speed)
+    if motion == 'diagonal':
+        return DiagonalSweepTrajectory(width, height, logo_w, logo_h, speed)
+    if motion == 'random':
+        return RandomJumpTrajectory(width, height, logo_w, logo_h, hold_frames, seed)
+    if motion == 'corners':
+        return CornerTrajectory(width, height, logo_w, logo_h, corners, hold_frames)
+    raise ValueError(f"Unknown motion '{motion}'; choose from {MOTIONS}")
@@ -1,5 +1,105 @@
+import os
+import time
+
 import cv2
-import numpy as np
+
+from utils.cancellation import (
+    CANCEL_CHECK_FRAMES, CancelToken, ProcessingCancelled, remove_partial_output
+)
+from utils.compression import (
+    FFmpegWriter, encode_report, mux_audio, predicted_size_mb, probe_audio, remove_pass_logs,
+    size_target
+)
+from utils.decoder import open_video
+from utils.ffmpeg_backend import add_moving_watermark_ffmpeg
+from utils.layers import LayerStack, build_stack
+from utils.media_info import probe_media
+from utils.memory import peak_rss_mb, plan_memory
+from utils.options import BACKENDS
+from utils.overlay import WatermarkOverlay
+from utils.pipeline import default_worker_count, run_frame_pipeline
+from utils.progress import ProgressReporter
+from utils.static_skip import BLEND, REMEMBER, REUSE, StaticRegions
+
+
+def watermark_frames(
+    cap,
+    out,
+    overlay: WatermarkOverlay,
+    positions,
+    workers: int = None,
+    reporter: ProgressReporter = None,
+    cancel_token: CancelToken = None,
+    skip_static: bool = False,
+    max_in_flight: int = None
+) -> int:
+    """
+    Blend the overlay into every frame read from ``cap`` and write it to ``out``.
+
+    Stops when either the video or ``positions`` runs out, so a finite
+    slice of positions processes just that many frames.
+
+    Args:
+        cap: Opened cv2.VideoCapture or FFmpegReader
+        out: Writer with write(frame)
+        overlay: Prepared watermark overlay, or a LayerStack
+        positions: Iterable of per-frame blend_at() arguments: (x, y)
+            for an overlay, (placements,) for a LayerStack
+        workers: Blend threads; 1 runs serially, None uses one per core
+        reporter: Optional ProgressReporter fed with frames done and
+            decode/blend/encode times
+        cancel_token: Optional CancelToken, checked every few frames
+        skip_static: Copy the previous frame's blended pixels instead of
+            blending again while the position and the pixels under the
+            overlay are unchanged (see StaticRegions)
+        max_in_flight: Frames buffered by the threaded pipeline (see
+            run_frame_pipeline); the serial path always holds one
+
+    Returns:
+        Number of frames written
+    """
+    reporter = reporter or ProgressReporter()
+    if workers != 1:
+        return run_frame_pipeline(
+            cap, out, overlay, positions, workers=workers, max_in_flight=max_in_flight,
+            reporter=reporter, cancel_token=cancel_token, skip_static=skip_static
+        )
+
+    # One frame buffer is decoded into over and over; only the logo's ROI
+    # view is modified, and writers copy the frame out before the next read.
+    clock = time.perf_counter
+    written = 0
+    frame = None
+    statics = StaticRegions(overlay) if skip_static else None
+    for position in positions:
+        if cancel_token and written % CANCEL_CHECK_FRAMES == 0:
+            cancel_token.raise_if_cancelled()
+
+        started = clock()
+        ret, frame = cap.read(frame) if frame is not None else cap.read()
+        if not ret:
+            break
+        decoded = clock()
+
+        # Blend logo onto the Region of Interest in place
+        action = statics.check(frame, position) if statics else BLEND
+        if action == REUSE:
+            statics.reuse(frame, position)
+        else:
+            overlay.blend_at(frame, *position)
+            if action == REMEMBER:
+                statics.remember(frame, position)
+        blended = clock()
+
+        out.write(frame)
+        written += 1
+
+        reporter.add_time('decode', decoded - started)
+        reporter.add_time('blend', blended - decoded)
+        reporter.add_time('encode', clock() - blended)
+        reporter.advance()
+    return written
+
 
 def add_moving_watermark_with_alpha(
     input_video_path: str,
@@ -7,7 +107,28 @@ def add_moving_watermark_with_alpha(
     output_video_path: str,
     speed: int = 5,
     scale: float = 0.08,
-    opacity: float = 0.25
+    opacity: float = 0.25,
+    compress: bool = False,
+    quality: int = 23,
+    workers: int = None,
+    motion: str = 'bounce',
+    motion_options: dict = None,
+    target_size_mb: float = 10.0,
+    rate_control: str = 'crf',
+    preset: str = 'slow',
+    backend: str = 'opencv',
+    progress=None,
+    cancel_token: CancelToken = None,
+    reader: str = 'opencv',
+    decode_threads: int = 0,
+    layers: list = None,
+    skip_static: bool = False,
+    output_height: int = None,
+    max_size: tuple = None,
+    interpolation: str = 'area',
+    memory_budget_mb: float = None,
+    segments: int = None,
+    work_dir: str = None
 ):
     """
     Add a moving watermark with alpha channel to a video.
@@ -19,80 +140,199 @@ def add_moving_watermark_with_alpha(
         speed: Speed of watermark movement (pixels per frame)
         scale: Size of watermark relative to video height
         opacity: Opacity of watermark (0.0 to 1.0)
+        compress: Stream frames straight into FFmpeg (libx264 + source
+            audio) instead of writing an intermediate mp4v file
+        quality: CRF value used when compress is enabled
+        workers: Blend threads; 1 runs decode, blend and encode serially,
+            None uses one per core
+        motion: Motion pattern ('bounce', 'diagonal', 'random', 'corners')
+        motion_options: Extra make_trajectory() arguments, e.g. hold_seconds
+        target_size_mb: Target file size in MB for 'abr' and 'two-pass'
+        rate_control: 'crf', 'abr' or 'two-pass' (see video_encoder_args);
+            'two-pass' decodes and blends the video twice
+        preset: x264 preset used when compress is enabled
+        backend: 'opencv' blends frames in Python; 'ffmpeg' does the whole
+            job in FFmpeg's overlay filter (see add_moving_watermark_ffmpeg)
+        progress: Optional callback receiving ProgressReporter snapshots
+            (frames done of CAP_PROP_FRAME_COUNT, fps, ETA, time per stage)
+        cancel_token: Optional CancelToken; cancelling stops the frame loop
+            and FFmpeg, removes the partial output and raises
+            ProcessingCancelled
+        reader: Frame source for the 'opencv' backend: 'opencv'
+            (cv2.VideoCapture) or 'ffmpeg' (FFmpegReader, see open_video)
+        decode_threads: Decoder threads for the 'ffmpeg' reader (0 = auto)
+        layers: Extra image/text layers drawn above the logo in the same
+            pass, each with its own trajectory, opacity and time range (see
+            build_layers); logo_path may then be None
+        skip_static: For screen recordings and slides: reuse the blended
+            pixels while neither the source nor the watermark changes,
+            and with compress, drop exact duplicate frames before x264
+            so the output has variable frame rate timestamps
+        output_height: Downscale frames to this height (never upscaled)
+            right after decoding, so blending, piping and encoding all
+            work at the output size; ``scale`` is then relative to it
+        max_size: Alternatively or also, (width, height) to fit within
+        interpolation: Scaling filter: 'area', 'linear', 'cubic' or 'lanczos'
+        memory_budget_mb: Peak memory to stay within, FFmpeg included; the
+            frame ring, blend workers and x264 lookahead are sized from the
+            resolution to fit (see plan_memory), trading throughput for
+            memory on 4K/8K inputs
+        segments: Split the video at keyframes into this many segments,
+            render them in ``workers`` processes and join them without
+            re-encoding (see add_moving_watermark_segmented); needs
+            compress and a single-pass rate control
+        work_dir: With segments, keep finished segments in this directory
+            so a rerun after a crash only renders the rest
+
+    Returns:
+        Predicted versus actual size report when compress is enabled, with
+        the memory plan and peak_rss_mb (see peak_rss_mb)
     """
 
-    # Load video
-    cap = cv2.VideoCapture(input_video_path)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}'; choose from {BACKENDS}")
+    if not logo_path and not layers:
+        raise ValueError("A logo or at least one layer is required")
+    if backend == 'ffmpeg':
+        if layers:
+            raise ValueError("Layers are only supported by the 'opencv' backend")
+        if segments and segments > 1:
+            raise ValueError("Segments are only supported by the 'opencv' backend")
+        return add_moving_watermark_ffmpeg(
+            input_video_path, logo_path, output_video_path,
+            speed=speed, scale=scale, opacity=opacity, compress=compress,
+            quality=quality, motion=motion, motion_options=motion_options,
+            target_size_mb=target_size_mb, rate_control=rate_control, preset=preset,
+            progress=progress, cancel_token=cancel_token, output_height=output_height,
+            max_size=max_size, interpolation=interpolation, memory_budget_mb=memory_budget_mb
+        )
+
+    if segments and segments > 1:
+        if not compress or skip_static:
+            raise ValueError("Segments are joined as H.264 with constant frame rate; "
+                             "they need compress and no skip_static")
+        # Imported here: segments builds on this module's frame loop
+        from utils.segments import add_moving_watermark_segmented
+        return add_moving_watermark_segmented(
+            input_video_path, logo_path, output_video_path,
+            speed=speed, scale=scale, opacity=opacity, quality=quality,
+            processes=workers, segments=segments, motion=motion, motion_options=motion_options,
+            work_dir=work_dir, target_size_mb=target_size_mb, rate_control=rate_control, preset=preset,
+            layers=layers, progress=progress, cancel_token=cancel_token, output_height=output_height,
+            max_size=max_size, interpolation=interpolation, memory_budget_mb=memory_budget_mb
+        )
+
+    # Load video, already scaled to the output size
+    geometry = {'output_height': output_height, 'max_size': max_size, 'interpolation': interpolation}
+    cap = open_video(input_video_path, reader, decode_threads, cancel_token, **geometry)
     if not cap.isOpened():
         raise FileNotFoundError(f"Cannot open video: {input_video_path}")
 
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
+    memory = None
+    max_in_flight = None
+    lookahead = None
+    if memory_budget_mb:
+        try:
+            info = probe_media(input_video_path)
+            source_size = (info.width, info.height) if info.has_video else None
+        except FileNotFoundError:
+            source_size = None
+        memory = plan_memory(
+            (width, height), memory_budget_mb, workers or default_worker_count(), preset,
+            compress=compress, source_size=source_size
+        )
+        workers, max_in_flight, lookahead = memory['workers'], memory['max_in_flight'], memory['lookahead']
 
-    # Load logo image with alpha channel
-    logo = cv2.imread(logo_path, cv2.IMREAD_UNCHANGED)
-    if logo is None:
-        raise ValueError("Cannot load logo image")
+    stack = build_stack(
+        logo_path, layers, width, height, fps, scale, opacity, motion, speed, motion_options
+    )
 
-    # Convert to RGBA if not already
-    if logo.shape[2] == 3:
-        logo = cv2.cvtColor(logo, cv2.COLOR_BGR2BGRA)
+    # A lone logo blends directly; several layers are composited together
+    if len(stack) == 1:
+        overlay, positions = stack[0].overlay, stack[0].trajectory.positions
+    else:
+        overlay = LayerStack(stack)
+        positions = overlay.positions
 
+    if not compress:
+        # cv2.VideoWriter cannot write audio, so the source's audio track is
+        # copied in afterwards (re-encoded only if the container needs it)
+        has_audio = probe_audio(input_video_path) is not None
+        root, ext = os.path.splitext(output_video_path)
+        video_path = f'{root}.video{ext}' if has_audio else output_video_path
 
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(video_path, fourcc, fps, (width, height))
+        reporter = ProgressReporter(progress, 'watermark', frame_count)
+        try:
+            try:
+                watermark_frames(
+                    cap, out, overlay, positions(), workers=workers, reporter=reporter,
+                    cancel_token=cancel_token, skip_static=skip_static, max_in_flight=max_in_flight
+                )
+            finally:
+                cap.release()
+                out.release()
+            if has_audio:
+                started = time.perf_counter()
+                mux_audio(video_path, input_video_path, output_video_path, cancel_token)
+                reporter.add_time('mux', time.perf_counter() - started)
+        except ProcessingCancelled:
+            remove_partial_output(output_video_path)
+            raise
+        finally:
+            if has_audio:
+                remove_partial_output(video_path)
+        reporter.finish()
+        return None
 
-    # Resize logo
-    speed = int(speed)
-    logo_h = int(height * float(scale))
-    logo_w = int(logo.shape[1] * (logo_h / logo.shape[0]))
-    logo = cv2.resize(logo, (logo_w, logo_h), interpolation=cv2.INTER_AREA)
-
-    # Initial position and direction
-    x, y = 0, 0
-    dx, dy = speed, speed
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    duration = frame_count / fps if fps else 0
+    bitrate_kbps, audio_kbps = size_target(
+        input_video_path, output_video_path, rate_control, target_size_mb, duration
+    )
 
-        # Bounce logic
-        if x + logo_w >= width or x <= 0:
-            dx *= -1
-        if y + logo_h >= height or y <= 0:
-            dy *= -1
+    passlog = os.path.splitext(output_video_path)[0] + '.passlog'
+    passes = [1, 2] if rate_control == 'two-pass' else [None]
+    stage_seconds = {}
+    try:
+        for pass_number in passes:
+            stage = f'watermark pass {pass_number}/2' if pass_number else 'watermark'
+            reporter = ProgressReporter(progress, stage, frame_count)
+            if pass_number == 2:
+                cap.release()
+                cap = open_video(input_video_path, reader, decode_threads, cancel_token, **geometry)
 
-        x += dx
-        y += dy
-
-        # Ensure coordinates are within bounds
-        x = int(round(max(0, min(x, width - logo_w))))
-        y = int(round(max(0, min(y, height - logo_h))))
-
-        # Region of Interest
-        roi = frame[y:y+logo_h, x:x+logo_w]
-
-        # Ensure ROI and logo have the same dimensions
-        if roi.shape != logo.shape[:2]:
-            logo = cv2.resize(logo, (roi.shape[1], roi.shape[0]))
-
-        # Split the logo into color and alpha channels
-        logo_bgr = logo[:, :, :3]
-        alpha = logo[:, :, 3] / 255.0  # Normalize alpha to 0-1
-        alpha = alpha * opacity  # Apply additional opacity
-
-        # Create mask for blending
-        mask = alpha.reshape(alpha.shape[0], alpha.shape[1], 1)
-        mask = np.repeat(mask, 3, axis=2)
-
-        # Blend logo onto ROI using alpha channel
-        blended = roi * (1 - mask) + logo_bgr * mask
-        frame[y:y+logo_h, x:x+logo_w] = blended.astype(np.uint8)
-
-        out.write(frame)
+            out = FFmpegWriter(
+                output_video_path, (width, height), fps,
+                audio_source_path=input_video_path, quality=quality, preset=preset,
+                rate_control=rate_control, bitrate_kbps=bitrate_kbps,
+                pass_number=pass_number, passlog=passlog, cancel_token=cancel_token,
+                drop_duplicates=skip_static, lookahead=lookahead, frame_count=frame_count
+            )
+            try:
+                watermark_frames(
+                    cap, out, overlay, positions(), workers=workers, reporter=reporter,
+                    cancel_token=cancel_token, skip_static=skip_static, max_in_flight=max_in_flight
+                )
+            finally:
+                out.release()
+            for name, seconds in reporter.finish()['stage_seconds'].items():
+                stage_seconds[name] = round(stage_seconds.get(name, 0.0) + seconds, 3)
+    except ProcessingCancelled:
+        remove_partial_output(output_video_path)
+        raise
+    finally:
+        cap.release()
+        remove_pass_logs(passlog)
 
-    cap.release()
-    out.release() 
\ No newline at end of file
+    predicted_mb = predicted_size_mb(rate_control, bitrate_kbps, duration, audio_kbps)
+    report = encode_report(output_video_path, rate_control, preset, predicted_mb)
+    report['stage_seconds'] = stage_seconds
+    report['memory'] = memory
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
@@ -0,0 +1 @@
+__version__ = '1.0.0'  # Keep in step with file_version_info.txt